@@ -4,9 +4,22 @@
     This is a utility to read a Subsurface xml dive log and generate
     a more traditional looking list of dives.
 """
+# pylint: disable=C0302
+#   it is more convenient to keep this a single (copyable) script
 
+import csv
+import hashlib
+import heapq
+import io
+import json
+import os
+import sys
 import xml.etree.ElementTree as ET
-from dataclasses import dataclass
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import astuple, dataclass
+from math import isnan, nan
 
 
 def to_feet(meters):
@@ -42,129 +55,663 @@ class Statics:
     line_count = 0   # (total) number of lines output so far
 
 
-class Logdump:
-    """
-        digest SubSurface logs and output a simple line-per-dive summary
+def to_seconds(duration):
+    """ utility function to convert a Subsurface "m:ss min" into seconds """
+    (x, _) = duration.split(' ')
+    seconds = 0
+    for part in x.split(':'):
+        seconds = (seconds * 60) + int(part)
+    return seconds
 
-        the particular information to be included in the summary is
-        what I wanted to see, and a few aspects of this output are tied
-        to the way I encode info in my own log (e.g. how I encode viz)
-    """
-    # output columns
-    FORMAT = "%6s  %8s %5s  %4s  %4s  %4s  %4s  %4s   %s"
-    f_title = \
-        ("  num", "date    ", "start", "depth", "time ", "temp", "viz",
-         "rate", "location")
-    f_lines = \
-        ("-----", "--------", "-----", "-----", "-----", "----", "---",
-         "----", "--------")
 
-    # persistent instance state
-    root = None         # root of the XML tree
+class Profiles:
+    """
+        accumulate the divecomputer samples (time, depth, temperature)
+        from many dives into contiguous arrays, and compute per-dive
+        profile statistics over all of them at once (with numpy)
+    """
+    STOP_MIN = 3.0      # safety stop depth range (meters)
+    STOP_MAX = 6.0
+    STOP_TIME = 180     # minimum safety stop (seconds)
+    BAND = 20           # time-at-depth histogram bands (feet)
 
-    def __init__(self, file, parms):
-        self.statics = parms
-        tree = ET.parse(file)
-        self.root = tree.getroot()
-        self.sitemap = {}
+    def __init__(self):
+        self.dives = []                 # DiveSummary for each dive
+        self.dive = array('l')          # dive index for each sample
+        self.time = array('d')          # seconds into dive
+        self.depth = array('d')         # meters
+        self.temp = array('d')          # centegrade (or NaN)
 
-    # pylint: disable=R0912, R0914, R0915
-    #   This code would be much harder to understand if I broke it
-    #   into 9 different routines to generate each output field.
-    def dump_dive(self, dive, buddy):
+    def add(self, summary, dive):
         """
-            print a record for a single dive
+            add the samples for another dive
 
             args:
+                summary: DiveSummary for the dive
                 dive:   XML Element for the dive
-                buddy:  only print if buddy matches
-                        (to enble me to track Lynnette's dives)
+        """
+        dive_comp = dive.find('divecomputer')
+        if dive_comp is None:
+            return
+
+        index = len(self.dives)
+        self.dives.append(summary)
+        depth = 0.0
+        for sample in dive_comp.iter('sample'):
+            when = sample.get('time')
+            if when is None:
+                continue
+
+            # depth is only logged when it changes
+            meters = sample.get('depth')
+            if meters is not None:
+                depth = float(meters.split(' ')[0])
+            temp = sample.get('temp')
 
+            self.dive.append(index)
+            self.time.append(to_seconds(when))
+            self.depth.append(depth)
+            self.temp.append(nan if temp is None
+                             else float(temp.split(' ')[0]))
+
+    # pylint: disable=R0914
+    #   the intermediate arrays are what make this readable
+    def compute(self):
         """
-        # see if we have to match a buddy
-        if buddy is not None:
-            this_buddy = dive.find('buddy')
-            if this_buddy is None or this_buddy.text != buddy:
-                return
-
-        # see if we need to output a page footer
-        if self.statics.page_len > 0:
-            last = self.statics.page_len - self.statics.page_pad
-            if self.statics.line_count >= last:
-                while self.statics.line_count < self.statics.page_len:
-                    print("")
-                    self.statics.line_count += 1
-                self.statics.line_count = 0
-
-        # see if we need to output a new header
-        if self.statics.line_count == 0:
-            while self.statics.line_count < self.statics.page_pad:
-                print("")
-                self.statics.line_count += 1
-
-            print(self.FORMAT % self.f_title)
-            print(self.FORMAT % self.f_lines)
-            self.statics.line_count += 2
+            compute the per-dive statistics
 
-        # dive number may be mine or buddy's
-        if buddy is not None or self.statics.buddy_dives > 0:
-            self.statics.buddy_dives = self.statics.buddy_dives + 1
-            dive_num = self.statics.buddy_dives
-        else:
-            dive_num = dive.get('number')
+            returns: dict of numpy arrays (one element per dive)
+                avg:    (time weighted) average depth (meters)
+                ascent: maximum ascent rate (meters/minute)
+                stop:   longest safety stop (seconds)
+                temp:   minimum water temperature (centegrade)
+            and the overall time-at-depth histogram
+                hist:   seconds in each BAND of depth
+        """
+        # pylint: disable=C0415
+        import numpy as np
+
+        num = len(self.dives)
+        dive = np.frombuffer(self.dive, dtype='l')
+        time = np.frombuffer(self.time)
+        depth = np.frombuffer(self.depth)
+        temp = np.frombuffer(self.temp)
+
+        # a segment is a pair of successive samples from the same dive
+        same = dive[1:] == dive[:-1]
+        seg_dive = dive[:-1][same]
+        seg_dt = np.diff(time)[same]
+        seg_dd = np.diff(depth)[same]
+        seg_mid = ((depth[1:] + depth[:-1]) / 2)[same]
+        seg_start = time[:-1][same]
+        seg_lo = np.minimum(depth[1:], depth[:-1])[same]
+        seg_hi = np.maximum(depth[1:], depth[:-1])[same]
+
+        # time weighted average depth
+        total = np.bincount(seg_dive, weights=seg_dt, minlength=num)
+        area = np.bincount(seg_dive, weights=seg_mid * seg_dt, minlength=num)
+        avg = np.divide(area, total, out=np.zeros(num), where=total > 0)
+
+        # maximum ascent rate
+        rate = np.divide(-seg_dd * 60, seg_dt,
+                         out=np.zeros(len(seg_dt)), where=seg_dt > 0)
+        ascent = np.zeros(num)
+        np.maximum.at(ascent, seg_dive, rate)
+
+        # when did each dive first reach its maximum depth
+        deepest = np.zeros(num)
+        np.maximum.at(deepest, dive, depth)
+        bottom = np.full(num, np.inf)
+        at_max = depth == deepest[dive]
+        np.minimum.at(bottom, dive[at_max], time[at_max])
+
+        # safety stop: longest run of (post-bottom) segments in range
+        in_stop = (seg_lo >= self.STOP_MIN) & (seg_hi <= self.STOP_MAX) & \
+            (seg_start >= bottom[seg_dive])
+        starts = in_stop & ~np.concatenate(([False], in_stop[:-1])) | \
+            in_stop & np.concatenate(([True], seg_dive[1:] != seg_dive[:-1]))
+        run = np.cumsum(starts) - 1
+        run_time = np.bincount(run[in_stop], weights=seg_dt[in_stop],
+                               minlength=int(starts.sum()))
+        stop = np.zeros(num)
+        np.maximum.at(stop, seg_dive[in_stop][starts[in_stop]], run_time)
+
+        # minimum water temperature
+        coldest = np.full(num, np.inf)
+        known = ~np.isnan(temp)
+        np.minimum.at(coldest, dive[known], temp[known])
+        coldest[np.isinf(coldest)] = np.nan
+
+        # overall time at depth
+        feet = seg_mid * 3.28084
+        bands = int(feet.max() // self.BAND) + 1 if len(feet) else 1
+        (hist, _) = np.histogram(feet, bins=bands,
+                                 range=(0, bands * self.BAND),
+                                 weights=seg_dt)
+
+        return {'avg': avg, 'ascent': ascent, 'stop': stop,
+                'temp': coldest, 'hist': hist}
+
+    def report(self):
+        """ print the per-dive profile statistics and depth histogram """
+        stats = self.compute()
+
+        form = "%6s  %8s  %5s  %6s  %5s  %4s"
+        print(form % ("  num", "date    ", "avg", "ascent", "stop", "min"))
+        print(form % ("-----", "--------", "-----", "------", "-----",
+                      "----"))
+        for (i, summary) in enumerate(self.dives):
+            (num, date, _, _, _, _, _, _, _) = summary.columns(summary.number)
+            avg = f"{to_feet(stats['avg'][i]):4d}'"
+            ascent = f"{to_feet(stats['ascent'][i]):3d}'/m"
+            secs = int(stats['stop'][i])
+            stop = f"{secs // 60:2d}:{secs % 60:02d}" \
+                if secs >= self.STOP_TIME else " none"
+            temp = "   " if isnan(stats['temp'][i]) \
+                else f"{to_far(stats['temp'][i]):3d}F"
+            print(form % (num, date, avg, ascent, stop, temp))
+
+        print("")
+        print("time at depth")
+        total = stats['hist'].sum()
+        for (band, secs) in enumerate(stats['hist']):
+            low = band * self.BAND
+            pct = 100 * secs / total if total > 0 else 0
+            print(f"{low:4d}-{low + self.BAND:3d}'  "
+                  f"{int(secs) // 60:7d} min  {pct:5.1f}%")
+
+
+# pylint: disable=R0902
+@dataclass
+class DiveSummary:
+    """
+        the (raw) information from one dive that goes into its summary
+        line.  These are small and picklable, so they can be passed
+        back from worker processes and sorted/merged.
+    """
+    number: str = None      # dive number (as logged)
+    date: str = None        # yyyy-mm-dd
+    time: str = None        # hh:mm:ss
+    duration: str = None    # mm:ss min
+    depth: float = None     # maximum depth (meters)
+    temp: float = None      # water temperature (centegrade)
+    viz: int = None         # visibility (stars)
+    rating: int = None      # rating (stars)
+    location: str = "???"   # dive site name
+    site: str = None        # dive site uuid
+    buddy: str = None       # buddy name
+
+    def key(self):
+        """ sort key: when the dive started """
+        return (self.date or "", self.time or "")
+
+    # pylint: disable=R0912, R0914
+    #   This code would be much harder to understand if I broke it
+    #   into 9 different routines to generate each output field.
+    def columns(self, dive_num):
+        """
+            format the fields for the output columns
+
+            args:
+                dive_num: the number to be shown for this dive
+            returns:    tuple of strings (one per Logdump column)
+        """
         if dive_num is not None:
             num = f"{int(dive_num):5d}"
         else:
             num = "  ???"
 
-        # get the basic info
-        dive_date = dive.get('date')
-        if dive_date is not None:
-            (year, mon, day) = dive_date.split('-')
+        if self.date is not None:
+            (year, mon, day) = self.date.split('-')
             date = f"{int(mon):02d}/{int(day):02d}/{int(year) % 100:02d}"
         else:
             date = "        "
 
-        dive_time = dive.get('time')
-        if dive_time is not None:
-            (hr, mins, _) = dive_time.split(':')
+        if self.time is not None:
+            (hr, mins, _) = self.time.split(':')
             time = f"{int(hr):02d}:{int(mins):02d}"
         else:
             time = "     "
 
-        dive_dur = dive.get('duration')
-        if dive_dur is not None:
-            (x, y) = dive_dur.split(' ')
+        if self.duration is not None:
+            (x, _) = self.duration.split(' ')
             (m, s) = x.split(':')
             dur = f"{int(m):02d}:{int(s):02d}"
         else:
             dur = "   ??"
 
-        dive_vis = dive.get('visibility')
-        if dive_vis is not None:
-            viz = f"{to_viz(int(dive_vis)):3d}'"
+        if self.viz is not None:
+            viz = f"{to_viz(self.viz):3d}'"
         else:
             viz = " "
 
-        dive_rating = dive.get('rating')
-        if dive_rating is not None:
-            rate = f"{int(dive_rating):1d}*"
+        if self.rating is not None:
+            rate = f"{self.rating:1d}*"
         else:
             rate = "  "
 
+        feet = "??? " if self.depth is None else f" {to_feet(self.depth):3d}"
+        temp = "   " if self.temp is None else f"{to_far(self.temp):3d}F"
+
+        return (num, date, time, feet, dur, temp, viz, rate, self.location)
+
+    def record(self, dive_num):
+        """
+            the (unpadded) output fields, for machine readable formats
+
+            args:
+                dive_num: the number to be shown for this dive
+            returns:    dict of output column name to value
+        """
+        return {
+            'num': None if dive_num is None else int(dive_num),
+            'date': self.date,
+            'start': self.time,
+            'depth': None if self.depth is None else to_feet(self.depth),
+            'time': None if self.duration is None
+            else self.duration.split(' ')[0],
+            'temp': None if self.temp is None else to_far(self.temp),
+            'viz': None if self.viz is None else to_viz(self.viz),
+            'rate': self.rating,
+            'location': self.location}
+
+
+class DiveIndex:    # pylint: disable=R0903
+    """
+        in-memory indexes over the summaries of the dives in a log, so
+        that combined queries (date range, site, buddy, depth, rating)
+        can be answered by intersecting the matching sets rather than
+        re-examining every dive
+    """
+    def __init__(self, dives):
+        """
+            args:
+                dives:  list of DiveSummary
+        """
+        self.dives = dives
+
+        # sorted (key, dive) lists for range queries
+        by_date = sorted((s.date or "", i) for (i, s) in enumerate(dives))
+        self.dates = [d for (d, _) in by_date]
+        self.date_dives = [i for (_, i) in by_date]
+        by_depth = sorted((s.depth, i) for (i, s) in enumerate(dives)
+                          if s.depth is not None)
+        self.depths = [to_feet(d) for (d, _) in by_depth]
+        self.depth_dives = [i for (_, i) in by_depth]
+
+        # value -> {dive, ...} maps for equality queries
+        self.sites = {}
+        self.buddies = {}
+        self.ratings = {}
+        for (i, s) in enumerate(dives):
+            for site in (s.site, s.location):
+                if site is not None:
+                    self.sites.setdefault(site, set()).add(i)
+            self.buddies.setdefault(s.buddy, set()).add(i)
+            self.ratings.setdefault(s.rating, set()).add(i)
+
+    # pylint: disable=R0913
+    def select(self, *, since=None, until=None, site=None, buddy=None,
+               deeper=None, shallower=None, rating=None):
+        """
+            find the dives that match all of the specified criteria
+
+            args:
+                since:  first date (yyyy, yyyy-mm or yyyy-mm-dd)
+                until:  last date (inclusive, same forms as since)
+                site:   dive site name or uuid
+                buddy:  buddy name
+                deeper: minimum maximum-depth (feet)
+                shallower: maximum maximum-depth (feet)
+                rating: minimum rating (stars)
+            returns:    list of matching DiveSummary (in log order)
+        """
+        matches = []
+        if since is not None or until is not None:
+            lo = 0 if since is None else bisect_left(self.dates, since)
+            hi = len(self.dates) if until is None \
+                else bisect_right(self.dates, until + "\uffff")
+            matches.append(set(self.date_dives[lo:hi]))
+        if deeper is not None or shallower is not None:
+            lo = 0 if deeper is None else bisect_left(self.depths, deeper)
+            hi = len(self.depths) if shallower is None \
+                else bisect_right(self.depths, shallower)
+            matches.append(set(self.depth_dives[lo:hi]))
+        if site is not None:
+            matches.append(self.sites.get(site, set()))
+        if buddy is not None:
+            matches.append(self.buddies.get(buddy, set()))
+        if rating is not None:
+            matches.append(set().union(*(dives for (stars, dives)
+                                         in self.ratings.items()
+                                         if stars is not None
+                                         and stars >= rating)))
+
+        # start with the smallest set
+        if not matches:
+            return list(self.dives)
+        matches.sort(key=len)
+        found = matches[0].intersection(*matches[1:])
+        return [self.dives[i] for i in sorted(found)]
+
+
+class DiveCache:
+    """
+        a sidecar file (next to the log) of the DiveSummary records for
+        each dive, so that listing an unchanged log need not re-parse
+        the XML.
+
+        The first line is a (fixed length) JSON header describing the
+        log it was built from (size, mtime, SHA-1 of the contents), and
+        each following line is a JSON list of the DiveSummary fields.
+        The fixed length header can be rewritten in place, which means
+        that when new dives are added to the end of a log, we only have
+        to append them to the cache.
+    """
+    SUFFIX = ".cache"
+    HEADER_LEN = 256    # bytes (including newline) in the header line
+
+    def __init__(self, logfile):
+        self.logfile = logfile
+        self.name = logfile + self.SUFFIX
+
+    def fingerprint(self):
+        """ return the (size, mtime) of the log file """
+        info = os.stat(self.logfile)
+        return (info.st_size, info.st_mtime_ns)
+
+    def checksum(self):
+        """ return the SHA-1 of the log file contents """
+        digest = hashlib.sha1()
+        with open(self.logfile, 'rb') as instream:
+            for block in iter(lambda: instream.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def read(self):
+        """
+            read the existing cache
+            returns: (header dict, [DiveSummary, ...]) or (None, None)
+        """
+        try:
+            with open(self.name, 'rt', encoding='utf-8') as instream:
+                header = json.loads(instream.readline())
+                dives = [DiveSummary(*json.loads(line)) for line in instream]
+        except (OSError, ValueError, TypeError):
+            return (None, None)
+
+        if len(dives) != header.get('dives'):
+            return (None, None)     # e.g. an interrupted update
+        return (header, dives)
+
+    def write_header(self, outstream, header):
+        """ (re)write the fixed length header at the start of the cache """
+        line = json.dumps(header)
+        if len(line) >= self.HEADER_LEN:
+            raise ValueError(f"cache header too long: {line}")
+        outstream.seek(0)
+        outstream.write(line.ljust(self.HEADER_LEN - 1) + "\n")
+
+    def summaries(self, log):
+        """
+            get the summaries for all of the dives in a log, from the
+            cache if it is current, else by parsing the log (and then
+            updating the cache)
+
+            args:
+                log:    Logdump (stream=True) for this log
+            returns:    (number of trips, [DiveSummary, ...])
+        """
+        (size, mtime) = self.fingerprint()
+        (header, cached) = self.read()
+
+        # if the file has not been touched, the cache is good
+        if header is not None and \
+                header['size'] == size and header['mtime'] == mtime:
+            return (header['trips'], cached)
+
+        # if the contents have not changed, the cache is still good
+        sha1 = self.checksum()
+        if header is not None and header['sha1'] == sha1:
+            header['mtime'] = mtime
+            try:
+                with open(self.name, 'r+t', encoding='utf-8') as outstream:
+                    self.write_header(outstream, header)
+            except OSError:
+                sys.stderr.write(f"unable to update cache {self.name}\n")
+            return (header['trips'], cached)
+
+        # we have to parse the log
+        dives = list(log.summaries())
+        new_header = {'size': size, 'mtime': mtime, 'sha1': sha1,
+                      'dives': len(dives), 'trips': log.num_trips}
+
+        # if the old dives are unchanged, we need only add the new ones
+        if cached is not None and dives[:len(cached)] == cached:
+            added = dives[len(cached):]
+            mode = 'r+t'
+        else:
+            added = dives
+            mode = 'wt'
+
+        try:
+            with open(self.name, mode, encoding='utf-8') as outstream:
+                self.write_header(outstream, new_header)
+                outstream.seek(0, os.SEEK_END)
+                for dive in added:
+                    outstream.write(json.dumps(astuple(dive)) + "\n")
+        except OSError:
+            sys.stderr.write(f"unable to update cache {self.name}\n")
+
+        return (log.num_trips, dives)
+
+
+class TextOutput:
+    """
+        buffered fixed-width (optionally paginated) output
+
+        rows are accumulated and formatted a page at a time, and written
+        out with a single write per flush
+    """
+    # output columns
+    FORMAT = "%6s  %8s %5s  %4s  %4s  %4s  %4s  %4s   %s"
+    f_title = \
+        ("  num", "date    ", "start", "depth", "time ", "temp", "viz",
+         "rate", "location")
+    f_lines = \
+        ("-----", "--------", "-----", "-----", "-----", "----", "---",
+         "----", "--------")
+
+    BATCH = 1000        # rows to accumulate before writing
+
+    def __init__(self, parms, stream=None):
+        """
+            args:
+                parms:  Statics (page layout and running line count)
+                stream: where to write the output (default stdout)
+        """
+        self.statics = parms
+        self.stream = stream if stream is not None else sys.stdout
+        self.rows = []
+
+    def add(self, summary, dive_num):
+        """ add the line for another dive """
+        self.rows.append(summary.columns(dive_num))
+        if len(self.rows) >= self.BATCH:
+            self.flush()
+
+    def flush(self):
+        """ paginate and write out all of the accumulated rows """
+        parms = self.statics
+        lines = []
+        done = 0
+        while done < len(self.rows):
+            # see if we need to output a page footer
+            last = parms.page_len - parms.page_pad
+            if parms.page_len > 0 and parms.line_count >= last:
+                lines.extend([""] * (parms.page_len - parms.line_count))
+                parms.line_count = 0
+
+            # see if we need to output a new header
+            if parms.line_count == 0:
+                lines.extend([""] * parms.page_pad)
+                lines.append(self.FORMAT % self.f_title)
+                lines.append(self.FORMAT % self.f_lines)
+                parms.line_count = parms.page_pad + 2
+
+            # fill out the rest of this page
+            if parms.page_len > 0:
+                room = max(1, last - parms.line_count)
+            else:
+                room = len(self.rows)
+            page = self.rows[done:done + room]
+            lines.extend(self.FORMAT % row for row in page)
+            parms.line_count += len(page)
+            done += len(page)
+
+        if lines:
+            self.stream.write("\n".join(lines) + "\n")
+        self.rows = []
+
+
+class CsvOutput:
+    """ buffered CSV output (one header, one row per dive) """
+    FIELDS = ("num", "date", "start", "depth", "time", "temp", "viz",
+              "rate", "location")
+
+    BATCH = 1000        # rows to accumulate before writing
+
+    def __init__(self, stream=None):
+        """
+            args:
+                stream: where to write the output (default stdout)
+        """
+        self.stream = stream if stream is not None else sys.stdout
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator="\n")
+        self.writer.writerow(self.FIELDS)
+        self.count = 0
+
+    def add(self, summary, dive_num):
+        """ add the row for another dive """
+        record = summary.record(dive_num)
+        self.writer.writerow(record[k] for k in self.FIELDS)
+        self.count += 1
+        if self.count >= self.BATCH:
+            self.flush()
+
+    def flush(self):
+        """ write out all of the accumulated rows """
+        self.stream.write(self.buffer.getvalue())
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.count = 0
+
+
+class JsonOutput:
+    """ buffered JSON Lines output (one object per dive) """
+    BATCH = 1000        # rows to accumulate before writing
+
+    def __init__(self, stream=None):
+        """
+            args:
+                stream: where to write the output (default stdout)
+        """
+        self.stream = stream if stream is not None else sys.stdout
+        self.lines = []
+
+    def add(self, summary, dive_num):
+        """ add the object for another dive """
+        self.lines.append(json.dumps(summary.record(dive_num)))
+        if len(self.lines) >= self.BATCH:
+            self.flush()
+
+    def flush(self):
+        """ write out all of the accumulated objects """
+        if self.lines:
+            self.stream.write("\n".join(self.lines) + "\n")
+        self.lines = []
+
+
+def make_output(kind, parms, stream=None):
+    """
+        instantiate the output backend for a format
+
+        args:
+            kind:   "text", "csv" or "json"
+            parms:  Statics (for text pagination)
+            stream: where to write the output (default stdout)
+    """
+    if kind == "csv":
+        return CsvOutput(stream)
+    if kind == "json":
+        return JsonOutput(stream)
+    return TextOutput(parms, stream)
+
+
+class Logdump:
+    """
+        digest SubSurface logs and output a simple line-per-dive summary
+
+        the particular information to be included in the summary is
+        what I wanted to see, and a few aspects of this output are tied
+        to the way I encode info in my own log (e.g. how I encode viz)
+    """
+    # persistent instance state
+    root = None         # root of the XML tree
+    num_trips = 0       # trips seen by iterdives
+
+    def __init__(self, file, parms, stream=False, output=None):
+        """
+            args:
+                file:   name of the Subsurface log (None if this
+                        instance is only used for output)
+                parms:  Statics shared with the other instances
+                stream: parse incrementally (in stream_log) rather
+                        than reading the whole tree up front
+                output: output backend (default TextOutput)
+        """
+        self.statics = parms
+        self.output = output if output is not None else TextOutput(parms)
+        self.file = file
+        if not stream:
+            tree = ET.parse(file)
+            self.root = tree.getroot()
+        self.sitemap = {}
+
+    def summarize(self, dive):
+        """
+            extract the interesting information from a single dive
+
+            args:
+                dive:   XML Element for the dive
+            returns:    DiveSummary
+        """
+        summary = DiveSummary(number=dive.get('number'),
+                              date=dive.get('date'),
+                              time=dive.get('time'),
+                              duration=dive.get('duration'))
+
+        this_buddy = dive.find('buddy')
+        if this_buddy is not None:
+            summary.buddy = this_buddy.text
+
+        dive_vis = dive.get('visibility')
+        if dive_vis is not None:
+            summary.viz = int(dive_vis)
+
+        dive_rating = dive.get('rating')
+        if dive_rating is not None:
+            summary.rating = int(dive_rating)
+
         # get the location name
         dive_loc = dive.get('location')
-        uuid = dive.get('divesiteid')
+        summary.site = dive.get('divesiteid')
         if dive_loc is not None:
-            loc = dive_loc.text
-        elif uuid is not None:
-            loc = self.sitemap[uuid]
-        else:
-            loc = "???"
+            summary.location = dive_loc.text
+        elif summary.site is not None:
+            summary.location = self.sitemap[summary.site]
 
-        # get the maximum depth
-        feet = "??? "
-        temp = "   "
         dive_comp = dive.find('divecomputer')
         if dive_comp is not None:
             # maximum depth
@@ -172,27 +719,57 @@ class Logdump:
             if dive_depth is not None:
                 dive_max = dive_depth.get('max')
                 if dive_max is not None:
-                    (x, y) = dive_max.split(' ')
-                    feet = f" {to_feet(float(x)):3d}"
+                    (x, _) = dive_max.split(' ')
+                    summary.depth = float(x)
 
             # get the water temperature
             dive_temp = dive_comp.find('temperature')
             if dive_temp is not None:
                 x = dive_temp.get('water')
                 (y, _) = x.split(' ')
-                deg_f = to_far(float(y))
-                temp = f"{deg_f:3d}F"
+                summary.temp = float(y)
 
-        # now print it all out
-        print(self.FORMAT % (num, date, time, feet, dur, temp, viz, rate, loc))
-        self.statics.line_count += 1
+        return summary
 
-    def dump_log(self, buddy):
+    def dump_dive(self, dive, buddy):
         """
-            enumerate and list all the dives in this log
-            args buddy name (optional), only list matching dives
+            print a record for a single dive
+
+            args:
+                dive:   XML Element for the dive
+                buddy:  only print if buddy matches
+                        (to enble me to track Lynnette's dives)
+
+        """
+        self.dump_summary(self.summarize(dive), buddy)
+
+    def dump_summary(self, summary, buddy, number=None):
+        """
+            output the line for a single (summarized) dive
+
+            args:
+                summary: DiveSummary for the dive
+                buddy:  only print if buddy matches
+                number: dive number to use (rather than the logged one)
         """
-        # build up a divesite map
+        # see if we have to match a buddy
+        if buddy is not None and summary.buddy != buddy:
+            return
+
+        # dive number may be mine or buddy's
+        if number is not None:
+            dive_num = number
+        elif buddy is not None or self.statics.buddy_dives > 0:
+            self.statics.buddy_dives = self.statics.buddy_dives + 1
+            dive_num = self.statics.buddy_dives
+        else:
+            dive_num = summary.number
+
+        # and hand it to the output backend
+        self.output.add(summary, dive_num)
+
+    def build_sitemap(self):
+        """ build up the map from divesite uuid to name """
         sites = self.root.find('divesites')
         for child in sites:
             if child.tag == 'site':
@@ -201,6 +778,15 @@ class Logdump:
                 if sitename is not None and uuid is not None:
                     self.sitemap[uuid] = sitename
 
+    def dump_log(self, buddy):
+        """
+            enumerate and list all the dives in this log
+            args buddy name (optional), only list matching dives
+        """
+        # build up a divesite map (if we haven't already)
+        if not self.sitemap:
+            self.build_sitemap()
+
         # print header, initialize counters
         num_trips = 0
         num_dives = 0
@@ -218,14 +804,178 @@ class Logdump:
                         num_dives += 1
                 num_trips += 1
 
+        self.output.flush()
         return (num_trips, num_dives)
 
+    def stream_log(self, buddy):
+        """
+            like dump_log, but parse the log incrementally, printing
+            each dive as soon as it has been read, and discarding each
+            element once we are done with it (so that memory use does
+            not grow with the size of the log)
+
+            args buddy name (optional), only list matching dives
+        """
+        num_dives = 0
+        for dive in self.iterdives():
+            self.dump_dive(dive, buddy)
+            num_dives += 1
+            # (don't wait for a full batch, each line goes out now)
+            self.output.flush()
+
+        self.output.flush()
+        return (self.num_trips, num_dives)
+
+    def cached_log(self, buddy):
+        """
+            like dump_log, but get the dive summaries from the sidecar
+            cache (updating it if the log has changed)
+
+            args buddy name (optional), only list matching dives
+        """
+        (num_trips, dives) = DiveCache(self.file).summaries(self)
+        for summary in dives:
+            self.dump_summary(summary, buddy)
+
+        self.output.flush()
+        return (num_trips, len(dives))
+
+    def query_log(self, buddy, query, cache=False):
+        """
+            list the dives in this log that match a query
+
+            args:
+                buddy:  buddy name (optional), only list matching dives
+                query:  dict of DiveIndex.select criteria
+                cache:  use (and maintain) the sidecar cache
+        """
+        if cache:
+            (_, dives) = DiveCache(self.file).summaries(self)
+        else:
+            dives = list(self.summaries())
+        index = DiveIndex(dives)
+        found = index.select(buddy=buddy, **query)
+        for summary in found:
+            self.dump_summary(summary, buddy)
+
+        self.output.flush()
+        return (self.num_trips, len(found))
+
+    def profile_log(self, profiles, buddy):
+        """
+            add the samples from each (matching) dive in this log
+            to a Profiles accumulator
+
+            args:
+                profiles: Profiles to accumulate the samples
+                buddy:  only include dives with this buddy
+        """
+        num_dives = 0
+        for dive in self.iterdives():
+            summary = self.summarize(dive)
+            if buddy is None or summary.buddy == buddy:
+                profiles.add(summary, dive)
+                num_dives += 1
+
+        self.output.flush()
+        return (self.num_trips, num_dives)
+
+    def summaries(self):
+        """
+            (incrementally) summarize each dive in the log
+            returns: generator of DiveSummary
+        """
+        for dive in self.iterdives():
+            yield self.summarize(dive)
+
+    def iterdives(self):
+        """
+            incrementally parse the log, building up the divesite map
+            and counting trips as we go
+            returns: generator of dive Elements (each of which is
+                     discarded once the caller is done with it)
+        """
+        self.num_trips = 0
+
+        # we need the parent of each dive/site to be able to discard it
+        parents = []
+        for (event, elem) in ET.iterparse(self.file, ('start', 'end')):
+            if event == 'start':
+                parents.append(elem)
+                continue
+            parents.pop()
+
+            if elem.tag == 'site':
+                # Subsurface writes the divesites before the dives
+                sitename = elem.get('name')
+                uuid = elem.get('uuid')
+                if sitename is not None and uuid is not None:
+                    self.sitemap[uuid] = sitename
+            elif elem.tag == 'dive':
+                yield elem
+            elif elem.tag == 'trip':
+                self.num_trips += 1
+            else:
+                continue
+
+            # we are done with this element, so discard it
+            elem.clear()
+            if parents:
+                parents[-1].remove(elem)
+
+
+def summarize_log(file, buddy=None, cache=False):
+    """
+        (process pool worker) summarize all of the dives in a log
+
+        args:
+            file:   name of the log file
+            buddy:  only include dives with this buddy
+            cache:  use (and maintain) the sidecar cache
+        returns:    list of DiveSummary, sorted by date and time
+    """
+    log = Logdump(file, Statics(), stream=True)
+    if cache:
+        (_, dives) = DiveCache(file).summaries(log)
+    else:
+        dives = log.summaries()
+    dives = [s for s in dives if buddy is None or s.buddy == buddy]
+    dives.sort(key=DiveSummary.key)
+    return dives
+
+
+# pylint: disable=R0913, R0917
+def merge_logs(files, buddy, parms, jobs=None, cache=False, output=None):
+    """
+        parse multiple logs (in parallel), merge their dives by date and
+        time, and list them all with new (sequential) dive numbers
+
+        args:
+            files:  names of the log files
+            buddy:  buddy name (only applied to the first file)
+            parms:  Statics for the output
+            jobs:   number of worker processes (default: one per core)
+            cache:  use (and maintain) the sidecar caches
+            output: output backend (default TextOutput)
+        returns:    number of dives listed
+    """
+    buddies = [buddy] + [None] * (len(files) - 1)
+    caches = [cache] * len(files)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        logs = list(pool.map(summarize_log, files, buddies, caches))
+
+    # each log is already sorted, so we need only merge them
+    printer = Logdump(None, parms, stream=True, output=output)
+    num_dives = 0
+    for summary in heapq.merge(*logs, key=DiveSummary.key):
+        num_dives += 1
+        printer.dump_summary(summary, None, parms.buddy_dives + num_dives)
+    printer.output.flush()
+    parms.buddy_dives += num_dives
+
+    return num_dives
+
 
-# pylint: disable=W0511
-# TODO
-#     if I were cooler, when multiple file names were specified, I would
-#     accumulate them and then re-sort (and re-number) based on date and time
-#
 if __name__ == '__main__':
 
     # parse the arguments
@@ -237,6 +987,30 @@ if __name__ == '__main__':
     parser.add_argument("--buddy", type=str, default=None, help="buddy name")
     parser.add_argument("--dives", type=int, default='0',
                         help="buddy's previous dives")
+    parser.add_argument("--stream", action='store_true',
+                        help="incremental parse (for very large logs)")
+    parser.add_argument("--merge", action='store_true',
+                        help="merge (and renumber) dives from all logs")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="parallel parsers for --merge")
+    parser.add_argument("--cache", action='store_true',
+                        help="use/update a per-log summary cache")
+    parser.add_argument("--format", choices=("text", "csv", "json"),
+                        default="text", help="output format")
+    parser.add_argument("--profile", action='store_true',
+                        help="dive profile statistics (requires numpy)")
+    parser.add_argument("--since", type=str, default=None,
+                        help="first date (yyyy[-mm[-dd]])")
+    parser.add_argument("--until", type=str, default=None,
+                        help="last date (yyyy[-mm[-dd]])")
+    parser.add_argument("--site", type=str, default=None,
+                        help="dive site name")
+    parser.add_argument("--deeper", type=int, default=None,
+                        help="minimum depth (feet)")
+    parser.add_argument("--shallower", type=int, default=None,
+                        help="maximum depth (feet)")
+    parser.add_argument("--rating", type=int, default=None,
+                        help="minimum rating (stars)")
     args = parser.parse_args()
 
     # initialize the format parameters
@@ -246,15 +1020,47 @@ if __name__ == '__main__':
         statics.page_pad = 1 if args.pad == 0 else args.pad
     if args.dives is not None:
         statics.buddy_dives = args.dives
+    output_format = make_output(args.format, statics)
+
+    # dive profile statistics for all of the logs
+    if args.profile:
+        dive_profiles = Profiles()
+        buddy_name = args.buddy
+        for name in args.filename:
+            Logdump(name, statics, True).profile_log(dive_profiles, buddy_name)
+            buddy_name = None   # pylint: disable=C0103
+        dive_profiles.report()
+        sys.exit(0)
+
+    # merge all of the logs into a single list
+    if args.merge:
+        merge_logs(args.filename, args.buddy, statics, args.jobs,
+                   args.cache, output_format)
+        sys.exit(0)
+
+    # any query criteria
+    criteria = {k: getattr(args, k) for k in
+                ('since', 'until', 'site', 'deeper', 'shallower', 'rating')
+                if getattr(args, k) is not None}
 
     # process each log file
     buddy_name = args.buddy
     for name in args.filename:
         # instantiate the dumper
-        dumper = Logdump(name, statics)
+        dumper = Logdump(name, statics,
+                         args.stream or args.cache or bool(criteria),
+                         output_format)
 
         # generate the output
-        (_trips, _dives) = dumper.dump_log(buddy_name)
+        if criteria:
+            (_trips, _dives) = dumper.query_log(buddy_name, criteria,
+                                                args.cache)
+        elif args.cache:
+            (_trips, _dives) = dumper.cached_log(buddy_name)
+        elif args.stream:
+            (_trips, _dives) = dumper.stream_log(buddy_name)
+        else:
+            (_trips, _dives) = dumper.dump_log(buddy_name)
 
         # Kinky - because of the way I use this program, I only want the
         #         buddy argument to be used for the first file (assumed
@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+
+"""
+    Generate synthetic Subsurface logs (divesites, trips, stand-alone
+    dives, and divecomputer samples) and time the phases of the
+    different logdump.py modes on them, with peak memory for each.
+
+    Each mode is timed once without tracemalloc (for the times) and once
+    with it (for the peak memory), because tracing slows things down.
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from logdump import (DiveCache, Logdump, Profiles, Statics, TextOutput,
+                     make_output)
+
+SCALES = {"1k": 1000, "10k": 10000, "100k": 100000, "1m": 1000000}
+BUDDIES = ("Lynnette", "Chris", "Jenny", None, None)
+
+
+# pylint: disable=R0914
+def generate(path, dives, interval=30, seed=0):
+    """
+        write a synthetic Subsurface log
+
+        args:
+            path:   name of the file to be written
+            dives:  number of dives
+            interval: seconds between divecomputer samples
+            seed:   for the random number generator
+    """
+    rand = random.Random(seed)
+    num_sites = max(1, dives // 20)
+
+    with open(path, 'wt', encoding='utf-8') as out:
+        out.write("<divelog program='subsurface' version='3'>\n")
+        out.write("<settings>\n<divecomputerid model='Synthetic' "
+                  "deviceid='12345678' />\n</settings>\n")
+
+        out.write("<divesites>\n")
+        for site in range(num_sites):
+            out.write(f"<site uuid='{site:x}' name='Site {site}'>\n"
+                      f"<geo cat='2' origin='2' value='Country {site % 7}'/>"
+                      "\n</site>\n")
+        out.write("</divesites>\n")
+
+        out.write("<dives>\n")
+        number = 0
+        day = 0
+        while number < dives:
+            # about half of the dives are on (multi-day) trips
+            trip = rand.random() < 0.5
+            count = rand.randint(4, 12) if trip else 1
+            count = min(count, dives - number)
+            day += rand.randint(1, 20)
+            (year, doy) = (2000 + day // 365, day % 365)
+            (mon, mday) = (1 + doy // 31, 1 + doy % 28)
+            if trip:
+                out.write(f"<trip date='{year}-{mon:02d}-{mday:02d}' "
+                          f"time='08:00:00' location='Trip {number}'>\n")
+            for i in range(count):
+                number += 1
+                write_dive(out, rand, number,
+                           f"{year}-{mon:02d}-{mday:02d}", f"{8 + i % 9:02d}",
+                           rand.randrange(num_sites), interval)
+            if trip:
+                out.write("</trip>\n")
+        out.write("</dives>\n</divelog>\n")
+
+
+# pylint: disable=R0913, R0917
+def write_dive(out, rand, number, date, hour, site, interval):
+    """ write out one synthetic dive (with its profile samples) """
+    duration = rand.randint(20 * 60, 70 * 60)
+    depth = rand.uniform(6, 40)
+    temp = rand.uniform(8, 29)
+    out.write(f"<dive number='{number}' rating='{rand.randint(1, 5)}' "
+              f"visibility='{rand.randint(0, 5)}' divesiteid='{site:x}' "
+              f"date='{date}' time='{hour}:{rand.randint(0, 59):02d}:00' "
+              f"duration='{duration // 60}:{duration % 60:02d} min'>\n")
+    buddy = rand.choice(BUDDIES)
+    if buddy is not None:
+        out.write(f"  <buddy>{buddy}</buddy>\n")
+    out.write("  <divecomputer model='Synthetic' deviceid='12345678'>\n")
+    out.write(f"  <depth max='{depth:.1f} m' mean='{depth / 2:.1f} m' />\n")
+    out.write(f"  <temperature water='{temp:.1f} C' />\n")
+
+    # descend, bottom time, ascend with a safety stop
+    for secs in range(0, duration + 1, interval):
+        frac = secs / duration
+        if frac < 0.1:
+            meters = depth * frac * 10
+        elif frac < 0.8:
+            meters = depth * rand.uniform(0.7, 1.0)
+        elif frac < 0.9:
+            meters = 5.0
+        else:
+            meters = 5.0 * (1 - frac) * 10
+        line = f"  <sample time='{secs // 60}:{secs % 60:02d} min' " \
+            f"depth='{meters:.1f} m'"
+        if secs % 300 == 0:
+            line += f" temp='{temp:.1f} C'"
+        out.write(line + " />\n")
+    out.write("  </divecomputer>\n</dive>\n")
+
+
+def tree_mode(path, output):
+    """ the original (whole tree) mode, one phase at a time """
+    statics = Statics()
+    yield "parse"
+    log = Logdump(path, statics, output=output)
+    yield "sitemap"
+    log.build_sitemap()
+    yield "dump"
+    log.dump_log(None)
+
+
+def stream_mode(path, output):
+    """ incremental (iterparse) mode """
+    yield "dump"
+    Logdump(path, Statics(), True, output).stream_log(None)
+
+
+def cache_mode(path, output):
+    """ building the cache, and then using it """
+    cache = DiveCache(path)
+    if os.path.exists(cache.name):
+        os.remove(cache.name)
+    yield "cold"
+    Logdump(path, Statics(), True, output).cached_log(None)
+    yield "warm"
+    Logdump(path, Statics(), True, output).cached_log(None)
+
+
+def profile_mode(path, _output):
+    """ accumulating and analyzing the divecomputer samples """
+    profiles = Profiles()
+    yield "samples"
+    Logdump(path, Statics(), True).profile_log(profiles, None)
+    yield "compute"
+    profiles.compute()
+
+
+MODES = {"tree": tree_mode, "stream": stream_mode, "cache": cache_mode,
+         "profile": profile_mode}
+
+
+def run(mode, path, fmt, trace):
+    """
+        run each phase of a mode
+
+        args:
+            mode:   generator function for the mode
+            path:   name of the log file
+            fmt:    output format
+            trace:  measure peak memory (rather than time)
+        returns:    [(phase, seconds or peak bytes), ...]
+    """
+    results = []
+    with open(os.devnull, 'wt', encoding='utf-8') as devnull:
+        output = make_output(fmt, Statics(), devnull)
+        if isinstance(output, TextOutput):
+            output.statics.page_len = 0
+
+        phases = mode(path, output)
+        phase = next(phases)
+        while phase is not None:
+            if trace:
+                tracemalloc.start()
+            start = time.perf_counter()
+            following = next(phases, None)
+            elapsed = time.perf_counter() - start
+            if trace:
+                (_, peak) = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                results.append((phase, peak))
+            else:
+                results.append((phase, elapsed))
+            phase = following
+
+    return results
+
+
+def main():
+    """ generate the logs and run the requested benchmarks """
+    import argparse     # pylint: disable=C0415
+    parser = argparse.ArgumentParser(description='logdump.py benchmarks')
+    parser.add_argument("--scale", nargs='+', choices=SCALES.keys(),
+                        default=["1k", "10k"], help="numbers of dives")
+    parser.add_argument("--mode", nargs='+', choices=MODES.keys(),
+                        default=list(MODES.keys()), help="modes to time")
+    parser.add_argument("--format", choices=("text", "csv", "json"),
+                        default="text", help="output format")
+    parser.add_argument("--interval", type=int, default=30,
+                        help="seconds between samples")
+    parser.add_argument("--dir", type=str, default=None,
+                        help="where to put (and keep) the generated logs")
+    parser.add_argument("--no-memory", action='store_true',
+                        help="skip the (slower) peak memory runs")
+    args = parser.parse_args()
+
+    workdir = args.dir
+    if workdir is None:
+        # pylint: disable=R1732
+        tmp = tempfile.TemporaryDirectory()
+        workdir = tmp.name
+    os.makedirs(workdir, exist_ok=True)
+
+    form = "%5s  %8s  %8s  %9s  %9s  %9s"
+    print(form % ("scale", "MB", "mode", "phase", "seconds", "peak MB"))
+    print(form % ("-----", "--", "----", "-----", "-------", "-------"))
+    for scale in args.scale:
+        path = os.path.join(workdir, f"bench_{scale}_{args.interval}.ssrf")
+        if not os.path.exists(path):
+            sys.stderr.write(f"generating {path} ...\n")
+            generate(path, SCALES[scale], args.interval)
+        size = os.path.getsize(path) / (1 << 20)
+
+        for name in args.mode:
+            times = run(MODES[name], path, args.format, False)
+            peaks = [None] * len(times) if args.no_memory \
+                else [p for (_, p) in run(MODES[name], path, args.format,
+                                          True)]
+            for ((phase, secs), peak) in zip(times, peaks):
+                mem = "" if peak is None else f"{peak / (1 << 20):.1f}"
+                print(form % (scale, f"{size:.1f}", name, phase,
+                              f"{secs:.3f}", mem))
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
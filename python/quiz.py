@@ -4,11 +4,17 @@ This is a quiz utility that I wrote because I could not find the
 old Unix "quiz" application for Linux.
 """
 import argparse
+import asyncio
 import sys
+import time
+import heapq
+import json
 import math
+import pickle
 import unicodedata
-from random import randrange
-from os import getenv, path
+from random import random
+from concurrent.futures import ThreadPoolExecutor
+from os import getenv, listdir, path, stat
 
 
 # pylint: disable=invalid-name
@@ -19,22 +25,43 @@ SUBDIR = "Quizzes"      # default place (in $HOME) for quiz files
 ENCODING = "Latin-1"    # European languages
 HARD = "NEEDSWORK"      # tag for stuff I need to work on
 MINLINE = 5             # word, colon, tab, word, newline
+CACHE_VERSION = 2       # format of the compiled quiz cache
 
 
-class Quiz:
+class Quiz:    # pylint: disable=too-many-instance-attributes
     """
     Read a file of quiz questions, and conduct a session of question promts
     and answer checking.
     """
-    def __init__(self, quizfile, topics, reverse=False):
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, quizfile, topics, reverse=False, typos=0,
+                 progress=False):
         """
-        Digest the specified quiz file
-        :param quizfile (string): name of quiz file
+        Digest the specified quiz file(s)
+        :param quizfile (string or [string, ...]): name of quiz file, or
+            a list of quiz files whose questions are to be merged
         :param topics ([string, ...]): topics to be quizzed on
         :param reverse (bool): prompt with answers rather than questions
+        :param typos (int): number of typos to tolerate in answers
+        :param progress (bool): use/update the saved Leitner boxes
         """
-        self.quizfile = quizfile
+        files = [quizfile] if isinstance(quizfile, str) else quizfile
+        if len(files) == 1:
+            self.quizfile = files[0]
+            self.progress_file = sideFile(files[0], ".progress")
+        else:
+            # merged quizzes share one progress file, in their directory
+            self.quizfile = f"all quizzes in {path.commonpath(files)}"
+            self.progress_file = path.join(path.commonpath(files),
+                                           ".all.progress")
         self.questions = []
+        self.sources = []       # quiz file each question came from
+        self.hard = set()       # questions tagged HARD
+        self.boxes = None       # saved Leitner box for each question
+        self.answers = []
+        self.prompts = None     # question -> [question number, ...]
+        self.typos = typos
+        self.near = BKTree()
         self.col1 = "Question"
         self.bar1 = "--------"
         self.col2 = "Answer"
@@ -45,48 +72,178 @@ class Quiz:
         sys.stdout.reconfigure(encoding=ENCODING)
         # report on what quiz will cover
         if verbose:
-            sys.stdout.write(f"Quiz: {quizfile} ... ")
+            sys.stdout.write(f"Quiz: {self.quizfile} ... ")
+
+        # get the (compiled) contents of the quiz file(s)
+        if len(files) == 1:
+            compiled = self.load(files[0])
+        else:
+            with ThreadPoolExecutor() as pool:
+                compiled = self.merge(files, list(pool.map(self.load, files)))
+        self.width = compiled['width'][1 if reverse else 0]
+        headings = compiled['headings']
+        if headings is not None:
+            (q, a) = headings
+            (self.col1, self.col2) = (a, q) if reverse else (q, a)
+            self.bar1 = '-' * len(self.col1)
+            self.bar2 = '-' * len(self.col2)
+
+        # use the topic index to find the questions we want
+        for i in self.select(compiled, topics):
+            (cat, q, a, cmt) = compiled['entries'][i]
+            if HARD in cmt:
+                self.hard.add(len(self.questions))
+            self.sources.append(compiled['sources'][i])
+            self.questions.append((cat, a, q) if reverse else (cat, q, a))
+        self.index_answers()
+        if progress:
+            self.boxes = self.load_progress()
+
+        if verbose:
+            self.prologue(topics, reverse)
+
+    def choices(self, topics):
+        """
+        find the (already loaded) questions in the chosen topics
+        :param topics ([string, ...]): topics (none means all)
+        :return ([int, ...]): question numbers
+        """
+        if not topics:
+            return list(range(len(self.questions)))
+        return [choice for (choice, (cat, _q, _a)) in enumerate(self.questions)
+                if cat in topics or (HARD in topics and choice in self.hard)]
+
+    def select(self, compiled, topics):
+        """
+        use the topic index to find the entries for the chosen topics
+        :param compiled (dict): see compile
+        :param topics ([string, ...]): topics to be quizzed on
+        :return ([int, ...]): entry numbers (in file order)
+        """
+        if not topics:
+            return range(len(compiled['entries']))
+
+        wanted = set()
+        for t in topics:
+            wanted.update(compiled['index'].get(t, ()))
+        if HARD in topics:
+            wanted.update(compiled['hard'])
+        return sorted(wanted)
+
+    def merge(self, files, compilations):
+        """
+        merge the compiled forms of several quiz files into a single
+        catalog (topics that appear in several files are combined)
+        :param files ([string, ...]): names of the quiz files
+        :param compilations ([dict, ...]): compiled form of each
+        :return (dict): see compile
+        """
+        merged = {'entries': [], 'sources': [], 'index': {}, 'hard': [],
+                  'headings': None, 'width': (WIDTH, WIDTH)}
+        for (name, compiled) in zip(files, compilations):
+            base = len(merged['entries'])
+            merged['entries'].extend(compiled['entries'])
+            merged['sources'].extend([name] * len(compiled['entries']))
+            for (topic, entries) in compiled['index'].items():
+                merged['index'].setdefault(topic, []).extend(
+                    base + i for i in entries)
+            merged['hard'].extend(base + i for i in compiled['hard'])
+            if merged['headings'] is None:
+                merged['headings'] = compiled['headings']
+            merged['width'] = tuple(max(w) for w in
+                                    zip(merged['width'], compiled['width']))
+        return merged
+
+    def load(self, quizfile):
+        """
+        get the compiled form of a quiz file, from its cache if that
+        is still current, else by reading the quiz file (and then
+        updating the cache)
+        :param quizfile (string): name of quiz file
+        :return (dict): see compile
+        """
+        try:
+            info = stat(quizfile)
+        except OSError:
+            sys.stderr.write(f"unable to read Quiz file {quizfile}\n")
+            sys.exit(-1)
+        stamp = (CACHE_VERSION, info.st_size, info.st_mtime_ns)
+
+        cache = sideFile(quizfile, ".cache")
+        try:
+            with open(cache, 'rb') as instream:
+                compiled = pickle.load(instream)
+            if compiled['stamp'] == stamp:
+                return compiled
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError,
+                TypeError):
+            pass
+
+        compiled = self.compile(quizfile)
+        compiled['stamp'] = stamp
+        try:
+            with open(cache, 'wb') as outstream:
+                pickle.dump(compiled, outstream)
+        except OSError:
+            pass    # the cache is only an optimization
+
+        return compiled
+
+    def compile(self, quizfile):    # pylint: disable=too-many-locals
+        """
+        read a quiz file, parsing out the categories, questions, and
+        answers, and indexing them by topic
+        :param quizfile (string): name of quiz file
+        :return (dict):
+            entries [(cat, question, answer, comment), ...]
+            sources [quiz file name, ...] for each entry
+            index {topic: [entry number, ...]}
+            hard [entry number, ...] of the entries tagged HARD
+            headings (question, answer) column headings (or None)
+            width (forward, reverse) question column widths
+        """
+        entries = []
+        index = {}
+        hard = []
+        headings = None
+        width = [WIDTH, WIDTH]
 
-        # read the file, parsing out the categories, questions, and answers
-        line_num = 1
         try:
             with open(quizfile, 'rt', encoding=ENCODING) as instream:
-                for line in instream:
+                for (line_num, line) in enumerate(instream, 1):
                     # separate the text form any comment
-                    (cat, q, a, cmt) = self.parse(line, line_num, reverse)
+                    (cat, q, a, cmt) = self.parse(line, line_num, False,
+                                                  quizfile)
                     if cat and q and a:
-                        entry = (cat, q, a)
-
                         # figure out good column widths
-                        if len(entry[1]) > self.width:
-                            self.width = self.tab_stop(len(entry[1]))
+                        for (i, text) in enumerate((q, a)):
+                            if len(text) > width[i]:
+                                width[i] = self.tab_stop(len(text))
 
                         # one entry might be column headings
                         if cat == "Category":
-                            self.col1 = entry[1]
-                            self.bar1 = '-' * len(self.col1)
-                            self.col2 = entry[2]
-                            self.bar2 = '-' * len(self.col2)
-                        elif not topics or cat in topics:
-                            self.questions.append(entry)
-                        elif HARD in topics and HARD in cmt:
-                            self.questions.append(entry)
-
-                    line_num += 1
+                            headings = (q, a)
+                        else:
+                            index.setdefault(cat, []).append(len(entries))
+                            if HARD in cmt:
+                                hard.append(len(entries))
+                            entries.append((cat, q, a, cmt))
             # file is automatically closed at end of with
         except IOError:
             sys.stderr.write(f"unable to read Quiz file {quizfile}\n")
             sys.exit(-1)
 
-        if verbose:
-            self.prologue(topics, reverse)
+        return {'entries': entries, 'sources': [quizfile] * len(entries),
+                'index': index, 'hard': hard,
+                'headings': headings, 'width': tuple(width)}
 
-    def parse(self, line, linenum, reverse):
+    def parse(self, line, linenum, reverse, quizfile=None):
         """
         pylint says there are too many if statements in the above constructor
         :param line (string): to be parsed
         :param linenum (int): line number for error messages
         :param reverse (bool): reverse questions and answers
+        :param quizfile (string): file name for error messages
         :return (cat, question, answer, comment)
         """
         # separate out any comment
@@ -100,7 +257,7 @@ class Quiz:
         if len(text) < MINLINE:
             return (None, None, None, None)
         if text.count(':') != 1 or text.count('\t') == 0:
-            self.error(linenum, "not in colon/tab format")
+            self.error(linenum, "not in colon/tab format", quizfile)
             return (None, None, None, None)
 
         # lex off the category, question, and answer
@@ -136,16 +293,17 @@ class Quiz:
             sys.stdout.write("]")
         sys.stdout.write("\n")
 
-    def error(self, line, msg):
+    def error(self, line, msg, quizfile=None):
         """
         log an error message about the quiz file
         :param line (int): line nunber
         :param msg (string): complaint
+        :param quizfile (string): file (if not self.quizfile)
         """
-        sys.stderr.write("ERROR " + self.quizfile + " ")
-        if line > 0:
-            sys.stderr.write(f"line {line}")
-        sys.stderr.write(f": {msg}\n")
+        # (one write, as quiz files may be compiled in parallel threads)
+        where = f"line {line}" if line > 0 else ""
+        sys.stderr.write(f"ERROR {quizfile or self.quizfile} {where}: "
+                         f"{msg}\n")
 
     def session(self):
         """
@@ -153,19 +311,18 @@ class Quiz:
         :return score (int, int): correct out of total
         """
         # conduct the quiz until blank line or EOF
-        available = len(self.questions)
         asked = 0
         correct = 0
-        finished = [False] * len(self.questions)
+        scheduler = Scheduler(len(self.questions), self.start_boxes())
 
         # print out column headings
         sys.stdout.write(f"{self.col1:{self.width}}\t{self.col2}\n")
         sys.stdout.write(f"{self.bar1:{self.width}}\t{self.bar2}\n")
-        while correct < available:
+        while True:
             # choose a yet unanswered question
-            choice = randrange(0, available)
-            if finished[choice]:
-                continue
+            choice = scheduler.next()
+            if choice is None:
+                break
             (_cat, question, answer) = self.questions[choice]
 
             # ask the question
@@ -180,9 +337,9 @@ class Quiz:
                 ok = self.check(reply, choice)
                 if ok:
                     correct += 1
-                    finished[choice] = True
             else:
                 ok = False
+            scheduler.answered(choice, ok)
 
             if verbose or not ok:
                 msg = "  CORRECT" if ok else "  INCORRECT"
@@ -191,8 +348,84 @@ class Quiz:
             asked += 1
 
         sys.stdout.write("\n")
+        if self.boxes is not None:
+            self.save_progress(scheduler.boxes)
         return (correct, asked)
 
+    def start_boxes(self):
+        """
+        the Leitner box each question starts the session in: its saved
+        box if we are tracking progress (new HARD questions start in
+        the first box), else all questions start out equal
+        :return ([int, ...]): box for each question
+        """
+        if self.boxes is None:
+            return [0] * len(self.questions)
+
+        boxes = []
+        for (choice, (cat, question, _answer)) in enumerate(self.questions):
+            default = 0 if choice in self.hard else 1
+            boxes.append(self.boxes.get(f"{cat}:{question}", default))
+        return boxes
+
+    def load_progress(self):
+        """
+        read the saved Leitner boxes for this quiz
+        :return (dict): category:question -> box
+        """
+        try:
+            with open(self.progress_file, 'rt',
+                      encoding=ENCODING) as instream:
+                return json.load(instream)
+        except (OSError, ValueError):
+            return {}
+
+    def save_progress(self, boxes):
+        """
+        update the saved Leitner boxes for this quiz
+        :param boxes ([int, ...]): box for each question
+        """
+        for (choice, (cat, question, _answer)) in enumerate(self.questions):
+            self.boxes[f"{cat}:{question}"] = boxes[choice]
+        try:
+            with open(self.progress_file, 'wt',
+                      encoding=ENCODING) as outstream:
+                json.dump(self.boxes, outstream, indent=1)
+        except OSError:
+            self.error(0, "unable to save progress")
+
+    def grade(self, instream, scores):
+        """
+        grade a stream of (non-interactive) replies, using the same
+        rules as check (but without printing corrections)
+        :param instream (file): lines of student<tab>question<tab>reply
+        :param scores (dict): student -> [correct, total], to be updated
+        """
+        # a question (prompt) may appear under several categories
+        if self.prompts is None:
+            self.prompts = {}
+            for (choice, (_cat, question, _ans)) in enumerate(self.questions):
+                self.prompts.setdefault(question, []).append(choice)
+
+        for (line_num, line) in enumerate(instream, 1):
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 3:
+                if line.strip():
+                    self.error(line_num, "not in student/question/reply "
+                               "format", getattr(instream, 'name', "batch"))
+                continue
+            (student, question, reply) = (f.strip() for f in fields)
+            choices = self.prompts.get(question)
+            if choices is None:
+                self.error(line_num, f"unknown question: {question}",
+                           getattr(instream, 'name', "batch"))
+                continue
+
+            score = scores.setdefault(student, [0, 0])
+            score[1] += 1
+            if reply and any(self.match(reply, c)[0] for c in choices):
+                score[0] += 1
+
     def check(self, answer, choice):
         """
         check the correctess of an answer
@@ -200,21 +433,55 @@ class Quiz:
         :param choice (int): question number
         :return: boolean
         """
-        # compare given answer with all correct ones
-        (_cat, _question, correct) = self.questions[choice]
-        possibilities = correct.split(',')
-        for ans in possibilities:
-            if answer == ans.strip():
-                return True
+        (ok, correction) = self.match(answer, choice)
+        # print out what it should have been
+        if correction is not None:
+            sys.stdout.write(f"{' ':{self.width}}\t{correction}\n")
+        return ok
 
-            # user may not be able to enter accents
-            simpler = strip_accents(ans.strip())
-            # print out what it should have been
-            if answer == simpler:
-                sys.stdout.write(f"{' ':{self.width}}\t{ans.strip()}\n")
-                return True
+    def match(self, answer, choice):
+        """
+        compare an answer with the (pre-normalized) correct ones
+        :param answer (string): given answer
+        :param choice (int): question number
+        :return (bool, string): correct, and the properly spelled
+            answer if the given one was only close (else None)
+        """
+        (exact, simpler) = self.answers[choice]
+        if answer in exact:
+            return (True, None)
+
+        # user may not be able to enter accents
+        if answer in simpler:
+            return (True, simpler[answer])
 
-        return False
+        # or might have made a typo
+        if self.typos > 0:
+            near = self.near.search(strip_accents(answer), self.typos)
+            for postings in near:
+                if choice in postings:
+                    return (True, postings[choice])
+
+        return (False, None)
+
+    def index_answers(self):
+        """
+        normalize the (comma separated) answers to every question once,
+        into a set of exact answers and a map from accent-stripped
+        answer to the proper one, and (if we are tolerating typos) a
+        BK-tree of all of the accent-stripped answers
+        """
+        self.answers = []
+        for (choice, (_cat, _question, correct)) in enumerate(self.questions):
+            exact = set()
+            simpler = {}
+            for ans in correct.split(','):
+                ans = ans.strip()
+                exact.add(ans)
+                simpler.setdefault(strip_accents(ans), ans)
+                if self.typos > 0:
+                    self.near.add(strip_accents(ans), choice, ans)
+            self.answers.append((exact, simpler))
 
     def tab_stop(self, number):
         """
@@ -225,6 +492,140 @@ class Quiz:
         return math.ceil(number / TAB_STOP) * TAB_STOP
 
 
+class Scheduler:
+    """
+    Choose which question to ask next.  Each question is in a Leitner
+    box (0 is the weakest).  The questions that may be asked now are in
+    a priority queue ordered by (box, not missed, random), so that each
+    choice is O(log n) and weaker questions come first; missed questions
+    wait in a second queue, ordered by when they may be asked again, so
+    that they come back GAP questions later (ahead of the others in
+    their box, or sooner, if nothing else is left to ask).
+    """
+    BOXES = 5           # number of Leitner boxes
+    GAP = 3             # questions before a missed one is asked again
+
+    def __init__(self, count, boxes):
+        """
+        :param count (int): number of questions
+        :param boxes ([int, ...]): starting box for each question
+        """
+        self.boxes = list(boxes)
+        self.missed = [False] * count
+        self.turn = 0
+        self.ready = [(self.boxes[c], True, random(), c)
+                      for c in range(count)]
+        heapq.heapify(self.ready)
+        self.waiting = []   # (turn when eligible, random, question)
+
+    def next(self):
+        """
+        choose the next question to be asked
+        :return (int): question number, or None if all are finished
+        """
+        while self.waiting and self.waiting[0][0] <= self.turn:
+            (_, rand, choice) = heapq.heappop(self.waiting)
+            heapq.heappush(self.ready,
+                           (self.boxes[choice], False, rand, choice))
+        if self.ready:
+            return heapq.heappop(self.ready)[3]
+        if self.waiting:
+            return heapq.heappop(self.waiting)[2]
+        return None
+
+    def answered(self, choice, ok):
+        """
+        record the result of asking a question
+        :param choice (int): question number
+        :param ok (bool): whether or not it was answered correctly
+        """
+        self.turn += 1
+        if ok:
+            # promote questions that were right the first time
+            if not self.missed[choice]:
+                self.boxes[choice] = min(self.boxes[choice] + 1,
+                                         self.BOXES - 1)
+        else:
+            # demote missed questions, and ask them again soon
+            self.missed[choice] = True
+            self.boxes[choice] = 0
+            heapq.heappush(self.waiting,
+                           (self.turn + self.GAP, random(), choice))
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of strings, for finding all of the strings
+    within a given edit distance of another without comparing it to
+    every one of them.  Each string carries the postings (question
+    number -> properly spelled answer) of the answers it came from.
+    """
+    def __init__(self):
+        self.root = None    # (word, postings, {distance: child})
+
+    def add(self, word, choice, answer):
+        """
+        add a (normalized) answer to the tree
+        :param word (string): normalized answer
+        :param choice (int): question number
+        :param answer (string): properly spelled answer
+        """
+        if self.root is None:
+            self.root = (word, {choice: answer}, {})
+            return
+
+        node = self.root
+        while True:
+            (text, postings, children) = node
+            dist = distance(word, text)
+            if dist == 0:
+                postings.setdefault(choice, answer)
+                return
+            if dist not in children:
+                children[dist] = (word, {choice: answer}, {})
+                return
+            node = children[dist]
+
+    def search(self, word, limit):
+        """
+        find the strings within an edit distance of the given one
+        :param word (string): normalized answer
+        :param limit (int): maximum edit distance
+        :return ([dict, ...]): postings of the matching strings
+        """
+        found = []
+        pending = [self.root] if self.root is not None else []
+        while pending:
+            (text, postings, children) = pending.pop()
+            dist = distance(word, text)
+            if dist <= limit:
+                found.append(postings)
+            # triangle inequality: no other child can be close enough
+            for d in range(max(1, dist - limit), dist + limit + 1):
+                if d in children:
+                    pending.append(children[d])
+        return found
+
+
+def distance(a, b):
+    """
+    Levenshtein (insert, delete, substitute) distance between strings
+    :param a (string): one string
+    :param b (string): the other
+    :return (int): number of edits to turn one into the other
+    """
+    if len(a) < len(b):
+        (a, b) = (b, a)
+    previous = list(range(len(b) + 1))
+    for (i, ca) in enumerate(a, 1):
+        current = [i]
+        for (j, cb) in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
 def strip_accents(string):
     """
     replace non-ASCII characters with their closest ASCII equivalents
@@ -238,6 +639,42 @@ def strip_accents(string):
     return "".join([c for c in nfd_form if not unicodedata.combining(c)])
 
 
+def sideFile(quizfile, suffix):
+    """
+    name of a (hidden, side-car) file for a quiz file (e.g. its
+    compiled cache or saved progress)
+    :param quizfile (string): name of quiz file
+    :param suffix (string): kind of side-car file
+    :return (string): name of side-car file
+    """
+    (directory, base) = path.split(quizfile)
+    return path.join(directory, "." + base + suffix)
+
+
+def quizDir():
+    """
+    :return (string): the directory in which to look for quizzes
+    """
+    quizdir = getenv("QUIZDIR")
+    if quizdir is None:
+        quizdir = getenv("HOME") + "/" + SUBDIR
+    return quizdir
+
+
+def quizFiles():
+    """
+    find all of the quiz files in the Quiz directory
+    :return ([string, ...]): full paths of the quiz files
+    """
+    quizdir = quizDir()
+    try:
+        names = sorted(listdir(quizdir))
+    except OSError:
+        return []
+    return [path.join(quizdir, n) for n in names
+            if not n.startswith('.') and path.isfile(path.join(quizdir, n))]
+
+
 def quizFile(name):
     """
     Figure out whether or not this names a quiz file
@@ -249,22 +686,185 @@ def quizFile(name):
         return name
 
     # is it the name of a file in a Quiz directory
-    quizdir = getenv("QUIZDIR")
-    if quizdir is None:
-        quizdir = getenv("HOME") + "/" + SUBDIR
-    maybe = quizdir + '/' + name
+    maybe = quizDir() + '/' + name
     if path.isfile(maybe):
         return maybe
 
     return None
 
 
-def main():
+class QuizServer:
+    """
+    Conduct many independent quiz sessions from one (warm) process:
+    the quizzes are read once, and each TCP connection (on localhost)
+    is a session with its own scheduler and score.  The protocol is
+    line oriented (so telnet or nc will do): the client names a quiz
+    (and, optionally, topics), and then answers one question per line.
+    """
+    HOST = "127.0.0.1"
+
+    def __init__(self, quizzes):
+        """
+        :param quizzes (dict): quiz name -> (preloaded) Quiz
+        """
+        self.quizzes = quizzes
+        self.latencies = []     # seconds to respond to each reply
+
+    def run(self, port):
+        """
+        accept and conduct sessions until interrupted
+        :param port (int): TCP port (on localhost) to listen on
+        """
+        sys.stderr.write(f"serving {len(self.quizzes)} quizzes on "
+                         f"{self.HOST}:{port}\n")
+        try:
+            asyncio.run(self.listen(port))
+        except KeyboardInterrupt:
+            pass
+        sys.stderr.write(f"{self.report(self.latencies)}\n")
+
+    async def listen(self, port):
+        """ accept connections, each of which becomes a session """
+        server = await asyncio.start_server(self.session, self.HOST, port)
+        async with server:
+            await server.serve_forever()
+
+    async def session(self, reader, writer):
+        """
+        conduct one quiz session over a connection
+        :param reader (StreamReader): replies from the client
+        :param writer (StreamWriter): prompts to the client
+        """
+        peer = writer.get_extra_info('peername')
+        latencies = []
+        (correct, asked) = (0, 0)
+        try:
+            names = " ".join(sorted(self.quizzes))
+            writer.write(f"quizzes: {names}\nquiz [topics ...]: "
+                         .encode(ENCODING))
+            words = (await reader.readline()).decode(ENCODING).split()
+            quiz = self.quizzes.get(words[0]) if words else None
+            if quiz is None:
+                writer.write(b"no such quiz\n")
+            else:
+                (correct, asked) = await self.ask(reader, writer, quiz,
+                                                  words[1:], latencies)
+        except (ConnectionError, UnicodeError):
+            pass
+        finally:
+            writer.close()
+            self.latencies.extend(latencies)
+            sys.stderr.write(f"{peer}: score {correct}/{asked}, "
+                             f"{self.report(latencies)}\n")
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    # pylint: disable=too-many-locals
+    async def ask(self, reader, writer, quiz, topics, latencies):
+        """
+        prompt with questions, read answers, and check results (like
+        Quiz.session, but over a connection)
+        :param reader (StreamReader): replies from the client
+        :param writer (StreamWriter): prompts to the client
+        :param quiz (Quiz): the quiz to be conducted
+        :param topics ([string, ...]): topics to be quizzed on
+        :param latencies ([float, ...]): to be updated with response times
+        :return score (int, int): correct out of total
+        """
+        choices = quiz.choices(topics)
+        scheduler = Scheduler(len(choices), [0] * len(choices))
+        (correct, asked) = (0, 0)
+
+        prompt = f"{quiz.col1:{quiz.width}}\t{quiz.col2}\n" + \
+            f"{quiz.bar1:{quiz.width}}\t{quiz.bar2}\n"
+        while True:
+            which = scheduler.next()
+            if which is None:
+                break
+            (_cat, question, answer) = quiz.questions[choices[which]]
+            writer.write(f"{prompt}{question+':':{quiz.width}}\t"
+                         .encode(ENCODING))
+            line = await reader.readline()
+            if not line:
+                break
+
+            # check the answer
+            start = time.perf_counter()
+            reply = line.decode(ENCODING).strip()
+            (ok, correction) = quiz.match(reply, choices[which]) \
+                if reply else (False, None)
+            scheduler.answered(which, ok)
+            correct += ok
+            asked += 1
+
+            prompt = ""
+            if correction is not None:
+                prompt += f"{' ':{quiz.width}}\t{correction}\n"
+            if verbose or not ok:
+                msg = "  CORRECT" if ok else "  INCORRECT"
+                prompt += f"{msg:{quiz.width}}\t{answer}\n"
+            latencies.append(time.perf_counter() - start)
+
+        writer.write(f"{prompt}\nscore: {correct}/{asked}\n"
+                     .encode(ENCODING))
+        await writer.drain()
+        return (correct, asked)
+
+    @staticmethod
+    def report(latencies):
+        """
+        summarize response latencies
+        :param latencies ([float, ...]): seconds per reply
+        :return (string): description
+        """
+        if not latencies:
+            return "no replies"
+        ordered = sorted(latencies)
+        mean = sum(ordered) / len(ordered)
+        return f"{len(ordered)} replies, latency " \
+            f"mean={mean * 1e6:.0f}us " \
+            f"median={ordered[len(ordered) // 2] * 1e6:.0f}us " \
+            f"max={ordered[-1] * 1e6:.0f}us"
+
+
+def batch(quiz, files):
+    """
+    grade files of student replies and print each student's score
+    :param quiz (Quiz): the quiz they were answering
+    :param files ([string, ...]): reply files ("-" for stdin)
+    :return (int): exit status
+    """
+    scores = {}
+    for name in files:
+        if name == "-":
+            sys.stdin.reconfigure(encoding=ENCODING)
+            quiz.grade(sys.stdin, scores)
+            continue
+        try:
+            with open(name, 'rt', encoding=ENCODING) as instream:
+                quiz.grade(instream, scores)
+        except IOError:
+            sys.stderr.write(f"unable to read batch file {name}\n")
+            return -1
+
+    sys.stdout.write("".join(f"{student}\t{correct}/{total}\n"
+                             for (student, (correct, total))
+                             in scores.items()))
+    return 0
+
+
+def main():     # pylint: disable=too-many-branches,too-many-statements
     """
     process the arguments, read the quiz file, and conduct the quiz
 
-    Usage: quiz.py [-v] [-r] [quiz] [topics ...]
+    Usage: quiz.py [-v] [-r] [-p] [-t typos] [quiz] [topics ...]
+           quiz.py -a [-v] [-r] [-p] [-t typos] [topics ...]
+           quiz.py -b replies [-b ...] [-r] [-t typos] [quiz] [topics ...]
+        -a  use all of the quizzes in QUIZDIR
+        -b  grade a file of student<tab>question<tab>reply lines
+        -s  serve the quiz (or with -a, all quizzes) on a localhost port
         -r  prompt w/answers, expect question
+        -p  remember (and focus on) weak questions
+        -t  number of typos to tolerate in answers
         -v  verboser output
     environment:
         QUIZFILE    default quiz file if none specified on CLI
@@ -279,6 +879,16 @@ def main():
                         help="quiz-file [topic ...]")
     parser.add_argument("-r", "--reverse", action='store_true',
                         help="reverse questions/answers")
+    parser.add_argument("-a", "--all", action='store_true',
+                        help="all quizzes in QUIZDIR")
+    parser.add_argument("-b", "--batch", action='append', default=None,
+                        help="grade student/question/reply file (- stdin)")
+    parser.add_argument("-s", "--serve", type=int, default=None,
+                        metavar="PORT", help="serve quizzes on localhost")
+    parser.add_argument("-p", "--progress", action='store_true',
+                        help="remember (and focus on) weak questions")
+    parser.add_argument("-t", "--typos", type=int, default=0,
+                        help="number of typos to tolerate")
     parser.add_argument("-v", "--verbose", action='store_true')
 
     args = parser.parse_args()
@@ -286,9 +896,15 @@ def main():
     # process the string arguments
     topics = []
     quiz_file_name = None
+    if args.all:
+        # all of the names are topics
+        quiz_file_name = quizFiles()
+        if not quiz_file_name:
+            sys.stderr.write(f"No quiz files in {quizDir()}\n")
+            sys.exit(-1)
     for i, name in enumerate(args.names):
         # first argument might be a quiz file name
-        if i == 0:
+        if i == 0 and not args.all:
             quiz_file_name = quizFile(name)
             if quiz_file_name is not None:
                 continue
@@ -311,11 +927,20 @@ def main():
     # pylint: disable=global-statement
     global verbose
     verbose = args.verbose
-    quiz = Quiz(quiz_file_name, topics, args.reverse)
+
+    # serve the preloaded quiz(zes) to many clients
+    if args.serve is not None:
+        files = quiz_file_name if args.all else [quiz_file_name]
+        quizzes = {path.basename(f): Quiz(f, [], args.reverse, args.typos)
+                   for f in files}
+        QuizServer(quizzes).run(args.serve)
+        sys.exit(0)
+    quiz = Quiz(quiz_file_name, topics, args.reverse, args.typos,
+                args.progress)
 
     # make sure we have digested some questions
     if len(quiz.questions) == 0:
-        sys.stderr.write("Quiz file " + quiz_file_name + " contains ")
+        sys.stderr.write("Quiz file " + quiz.quizfile + " contains ")
         sys.stderr.write("no questions")
         if len(topics) > 0:
             sys.stderr.write(" in categories:")
@@ -324,6 +949,10 @@ def main():
         sys.stderr.write('\n')
         sys.exit(2)
 
+    # grade the batch(es) of replies
+    if args.batch is not None:
+        sys.exit(batch(quiz, args.batch))
+
     # run the quiz
     (correct, total) = quiz.session()
     print(f"score: {correct}/{total}")
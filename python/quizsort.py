@@ -1,13 +1,29 @@
-#!/usr/bin/python
+#!/usr/bin/python3
 #
 #   This is a program to process exported moodle quiz files, putting
 #   them into per-category files (for editing and organization).
 #   It also has a -s (--summary) option that generates a list of
 #   question names.
 #
+#   Each export is read (a line at a time) by a single parser that
+#   turns it into a stream of Question objects, and the splitting,
+#   summary, and text outputs are all consumers of that stream, so
+#   any combination of them can be produced in one pass.
+#
+#   The -i (--index) option adds the exported questions to a full-text
+#   index, which the -q (--query) option can then search.
+#
 
+import hashlib
+import io
+import json
 import sys
 import os.path
+import re
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from itertools import repeat
 from optparse import OptionParser
 
 
@@ -29,7 +45,7 @@ def catFile(category):
     # find the last pathname component
     lastslash = category.rfind('/')
     if lastslash < 0:
-        sys.stderr.write("Category name w/o final slash: %s\n" % line)
+        sys.stderr.write("Category name w/o final slash: %s\n" % category)
         sys.exit(-1)
 
     # no embedded blanks in file names
@@ -60,6 +76,18 @@ def rawText(line):
     return line
 
 
+#
+# extract the (raw) text from a line containing a <text> element
+#
+def lineText(line):
+    """ the contents of the <text> element (or None if incomplete) """
+    start = line.find('<text>')
+    end = line.find('</text>')
+    if end > 0:
+        return rawText(line[start+6:end])
+    return None
+
+
 #
 # there are several different feedback types, and any text in
 # them is not a question or answer
@@ -68,6 +96,22 @@ feedback = ["feedback", "correctfeedback", "incorrectfeedback",
             "partiallycorrectfeedback"]
 
 
+#
+# where we remember the questions already put into category files
+#
+DEDUP_INDEX = ".quizsort_index.json"
+MANIFEST = ".quizsort_manifest.json"
+SEARCH_INDEX = ".quizsort_search.json"
+
+#
+# identification of a question (for dedup and manifests):
+#   (normalized) content hash, export file, ordinal position, Moodle
+#   number and hash of its exact lines
+#
+QuestionKey = namedtuple('QuestionKey',
+                         'digest source position number checksum')
+
+
 def isOpenFeedback(line):
     """ see if this line begins a feedback section """
     for token in feedback:
@@ -85,127 +129,113 @@ def isCloseFeedback(line):
 
 
 #
-# input processing state machine
-#   looks for categories and questions
-#   processes the categories, copies the questions
-#
-def process(file):
-    """ process an input file """
-    output = None
-    input = open(file, 'rb')
-    inCategory = False
-    inQuestion = False
-    for line in input:
-        if inQuestion:
-            output.write(line)
-            if '</question>' in line:
-                output.write('\n')
-                inQuestion = False
-        elif inCategory:
-            if '<text>$course$' in line:
-                if output is not None:
-                    output.close()
-                catName = category(line)
-                fileName = catFile(catName)
-
-                if os.path.isfile(fileName):
-                    # append to the existing file for this category
-                    output = open(fileName, 'a')
-                else:
-                    # create a new file for this category
-                    output = open(fileName, 'wb')
-                    output.write('<!-- question: 0 -->\n')
-                    output.write('  <question type="category">\n')
-                    output.write('    <category>\n')
-                    output.write('      <text>%s</text>\n' % (catName))
-                    output.write('    </category>\n')
-                    output.write('  </question>\n')
-                    output.write('\n')
-            elif '</question>' in line:
-                inCategory = False
-        else:
-            if '<!-- question: 0' in line:
-                inCategory = True
-            elif '<!-- question:' in line:
-                if output is not None:
-                    output.write(line)
-                inQuestion = True
-            # else:
-                # random input to be ignored
-
-    # close the output and input files
-    if output is not None:
-        output.close()
-    input.close()
-
-
+# one question (or category definition) from a Moodle export
 #
-# process a question text line and generate a one line summary
-#
-def list(line):
-    """ print out the text of a question """
-    # pull out the text
-    start = line.find('<text>')
-    end = line.rfind('</text>')
-    text = line[start+6:end].lstrip()
-
-    # pull out the CDATA
-    start = text.find('[CDATA[')
-    end = text.rfind(']]')
-    body = text[start+7:end].rstrip()
-
-    # pull out the paragraph (if any)
-    start = body.find('<p>')
-    if start >= 0:
-        end = body.rfind('</p>')
-        body = body[start + 3:end]
-
-    # pull out a trailing break (if any)
-    end = body.rfind('<br>')
-    if end >= 0:
-        body = body[0:end]
-
-    # print it out
-    if body != "":
-        print body
+class Question:
+    """ the parsed contents (and original lines) of one question """
+
+    def __init__(self, number):
+        self.number = number    # from the <!-- question: N --> comment
+        self.lines = []         # original lines (comment to </question>)
+        self.category = None    # full category name (category questions)
+        self.type = None        # question type
+        self.name = None        # question name
+        self.text = None        # (raw) question text
+        self.textLines = []     # lines between <questiontext> tags
+        self.answers = []       # (raw) answer texts
+        self.subquestions = []  # [(raw) sub-question and answer texts]
+        self.feedback = []      # (raw) feedback texts
+        self.source = None      # name of the export it came from
+
+    def isCategory(self):
+        """ is this a category definition rather than a question """
+        return self.type == "category"
+
+    def fullText(self):
+        """ the (raw) question text, even if it spans several lines """
+        if self.text is not None:
+            return self.text
+        joined = "".join(self.textLines)
+        start = joined.find('<text>')
+        end = joined.rfind('</text>')
+        if start < 0 or end < start:
+            return None
+        return rawText(joined[start+6:end].strip())
+
+    def digest(self):
+        """ hash of the (normalized) question text and answers """
+        def normal(text):
+            return " ".join(str(text).lower().split())
+
+        parts = [normal(self.type), normal(self.fullText())]
+        parts.extend(sorted(normal(a) for a in self.answers))
+        for texts in self.subquestions:
+            parts.append("|".join(normal(t) for t in texts))
+        return hashlib.sha1("\n".join(parts).encode('utf-8')).hexdigest()
+
+    def checksum(self):
+        """ hash of the exact question lines (names, fractions and all) """
+        return hashlib.sha1("".join(self.lines).encode('utf-8')).hexdigest()
 
 
 #
 # input processing state machine
-#   print out simple ASCII summaries of questions and answers
+#   turn a Moodle export into a stream of questions
 #
-def simpleText(file, tags):
-    """ print questions and answers in straight text """
-
-    qType = None
-    qName = None
-    cName = None
+def questions(file):
+    """ parse an export file, yielding each Question as it is completed """
+    q = None
     inCategory = False
     inQuestion = False
     inSubquestion = False
     inName = False
     inAnswer = False
     inFeedback = False
-    choiceNum = 0
-    choices = ["(a)", "(b)", "(c)", "(d)", "(e)", "(f)", "(g)",
-               "(h)", "(i)", "(j)"]
 
-    input = open(file, 'rb')
+    input = open(file, 'rt', encoding='utf-8')
     for line in input:
-        if qType is None:
+        if q is None:
+            if '<!-- question:' in line:
+                start = line.find('question:') + 9
+                q = Question(line[start:].replace('-->', '').strip())
+                q.lines.append(line)
+            elif '<question ' in line:
+                q = Question(None)
+                q.lines.append(line)
+            else:
+                # random input to be ignored
+                continue
+            q.source = file
+            if '<question ' not in line:
+                continue
+        else:
+            q.lines.append(line)
+
+        if q.type is None:
             if '<question ' in line:
                 start = line.find('type="')
                 if start > 0:
                     rest = line[start+6:]
                     end = rest.find('"')
                     if end > 0:
-                        qType = rest[0:end]
+                        q.type = rest[0:end]
                     else:
-                        qType = '!!!'
+                        q.type = '!!!'
                 else:
-                    qType = '???'
+                    q.type = '???'
+
+        # we have reached the end of a question
+        elif '</question>' in line:
+            yield q
+            q = None
+            inCategory = False
+            inQuestion = False
+            inSubquestion = False
+            inName = False
+            inAnswer = False
+            inFeedback = False
 
-        # in a question and we have its name
+        # the question name
         elif '<name>' in line:
             inName = True
         elif '</name>' in line:
@@ -214,104 +244,646 @@ def simpleText(file, tags):
             start = line.find('<text>')
             end = line.find('</text>')
             if end > 0:
-                qName = line[start+6:end]
+                q.name = line[start+6:end]
 
-        # in a question and we have its text
+        # the question text
         elif '<questiontext' in line:
             inQuestion = True
         elif '</questiontext' in line:
             inQuestion = False
-        elif inQuestion and '<text>' in line:
-            start = line.find('<text>')
-            end = line.find('</text>')
-            if end > 0:
-                question = rawText(line[start+6:end])
-            if cName is not None:
-                print(cName)
-            print(qType + ": " + qName)
-            print("    " + question)
+        elif inQuestion:
+            q.textLines.append(line)
+            if '<text>' in line:
+                q.text = lineText(line)
 
-        # in a sub-question and we have its text
+        # sub-questions (and their answers)
         elif '<subquestion' in line:
             inSubquestion = True
-            print
+            q.subquestions.append([])
         elif '</subquestion' in line:
             inSubquestion = False
         elif inSubquestion and '<text>' in line:
-            start = line.find('<text>')
-            end = line.find('</text>')
-            if end > 0:
-                question = rawText(line[start+6:end])
-            print("    " + question)
+            q.subquestions[-1].append(lineText(line))
 
-        # in a feedback section
+        # feedback sections
         elif isOpenFeedback(line):
             inFeedback = True
         elif isCloseFeedback(line):
             inFeedback = False
 
-        # in a question and we have an answer
+        # answers
         elif '<answer' in line:
             inAnswer = True
         elif '</answer>' in line:
             inAnswer = False
-        elif inAnswer and not inFeedback and '<text>' in line:
-            start = line.find('<text>')
-            end = line.find('</text>')
-            if end > 0:
-                answer = rawText(line[start+6:end])
-            if qType != "matching":
-                if tags:
-                    print("\n        " + choices[choiceNum] + ' ' + answer)
-                else:
-                    print("\n        " + answer)
-                choiceNum += 1
+        elif inAnswer and '<text>' in line:
+            text = lineText(line)
+            if text is None:
+                pass
+            elif inFeedback:
+                q.feedback.append(text)
             else:
-                print("        " + answer)
+                q.answers.append(text)
 
-        # in category section
+        # category definition
         elif '<category' in line:
             inCategory = True
         elif '</category' in line:
             inCategory = False
         elif inCategory and '<text>' in line:
-            # find the last pathname component
-            cat = category(line)
-            lastslash = cat.rfind('/')
-            if lastslash > 0:
-                cName = cat[lastslash + 1:]
+            q.category = category(line)
 
-        # we have reached the end of a question
-        elif '</question>' in line:
-            # end of question
-            qType = None
-            qName = None
-            inQuestion = False
-            inName = False
-            inAnswer = False
-            inFeedback = False
-            choiceNum = 0
+    input.close()
+
+
+#
+# persistent index of the questions we have already put into
+# category files, by (normalized) content
+#
+class DedupIndex:
+    """ question digest -> where it was first seen """
+
+    def __init__(self, fileName, skip):
+        self.fileName = fileName
+        self.skip = skip            # skip duplicates (else just report)
+        try:
+            with open(fileName, 'r', encoding='utf-8') as input:
+                self.seen = json.load(input)
+        except (OSError, ValueError):
+            self.seen = {}
+
+    def isNew(self, key, catName):
+        """ see if a QuestionKey is new, reporting duplicates """
+        digest = key.digest
+        where = "question %s of %s" % (key.number, key.source)
+        first = self.seen.get(digest)
+        if first is None:
+            self.seen[digest] = "%s: %s" % (catFile(catName), where)
+            return True
+
+        sys.stderr.write("duplicate: %s (first seen in %s)%s\n" %
+                         (where, first, ", skipped" if self.skip else ""))
+        return not self.skip
+
+    def save(self):
+        try:
+            with open(self.fileName, 'w', encoding='utf-8') as output:
+                json.dump(self.seen, output, indent=1)
+        except OSError:
+            sys.stderr.write("unable to save %s\n" % self.fileName)
+
+
+#
+# a pool of open (buffered) category files
+#
+class CategoryWriters:
+    """ append to per-category files, keeping the most recent ones open """
+
+    def __init__(self, maxOpen=64, bufSize=1 << 16, dedup=None):
+        self.maxOpen = maxOpen      # most files to keep open at once
+        self.bufSize = bufSize      # output buffer size (per file)
+        self.open = OrderedDict()   # file name -> output (LRU first)
+        self.started = set()        # files we know to have a header
+        self.dedup = dedup          # DedupIndex (if checking for dups)
+
+    def write(self, catName, lines, key=None):
+        # see if we already have this question
+        if self.dedup is not None and key is not None:
+            if not self.dedup.isNew(key, catName):
+                return
+
+        fileName = catFile(catName)
+        output = self.open.get(fileName)
+        if output is not None:
+            self.open.move_to_end(fileName)
+        else:
+            output = self.openFile(fileName, catName)
+        output.writelines(lines)
+
+    def openFile(self, fileName, catName):
+        # make room for another open file
+        if len(self.open) >= self.maxOpen:
+            (_, oldest) = self.open.popitem(last=False)
+            oldest.close()
+
+        if fileName in self.started or os.path.isfile(fileName):
+            # append to the existing file for this category
+            output = open(fileName, 'a', buffering=self.bufSize,
+                          encoding='utf-8')
+        else:
+            # create a new file for this category (when we first have
+            # a question to put in it)
+            output = open(fileName, 'w', buffering=self.bufSize,
+                          encoding='utf-8')
+            output.write('<!-- question: 0 -->\n')
+            output.write('  <question type="category">\n')
+            output.write('    <category>\n')
+            output.write('      <text>%s</text>\n' % (catName))
+            output.write('    </category>\n')
+            output.write('  </question>\n')
+            output.write('\n')
+        self.started.add(fileName)
+        self.open[fileName] = output
+        return output
+
+    def close(self):
+        # flush and close all of the output files
+        for output in self.open.values():
+            output.close()
+        self.open.clear()
+        if self.dedup is not None:
+            self.dedup.save()
+
+
+#
+# question consumer
+#   copy the questions into per-category files
+#
+class Splitter:
+    """ append each question to the file for its category """
+
+    def __init__(self, writers):
+        self.writers = writers
+        self.catName = None
+        self.position = 0
+
+    def consume(self, q):
+        if q.isCategory():
+            if q.category is not None and q.category.startswith('$course$'):
+                self.catName = q.category
+        elif self.catName is not None:
+            key = QuestionKey(q.digest(), q.source, self.position, q.number,
+                              q.checksum())
+            self.writers.write(self.catName, q.lines + ['\n'], key)
+            self.position += 1
+
+    def finish(self):
+        # the writers are shared by all input files
+        pass
+
+
+#
+# process a question text line and generate a one line summary
+#
+def list(line):
+    """ print out the text of a question """
+    # pull out the text
+    start = line.find('<text>')
+    end = line.rfind('</text>')
+    text = line[start+6:end].lstrip()
+
+    # pull out the CDATA
+    start = text.find('[CDATA[')
+    end = text.rfind(']]')
+    body = text[start+7:end].rstrip()
+
+    # pull out the paragraph (if any)
+    start = body.find('<p>')
+    if start >= 0:
+        end = body.rfind('</p>')
+        body = body[start + 3:end]
+
+    # pull out a trailing break (if any)
+    end = body.rfind('<br>')
+    if end >= 0:
+        body = body[0:end]
+
+    # print it out
+    if body != "":
+        print(body)
+
+
+#
+# question consumer
+#   print out simple ASCII summaries of questions and answers
+#
+class SimpleText:
+    """ print questions and answers in straight text """
+    choices = ["(a)", "(b)", "(c)", "(d)", "(e)", "(f)", "(g)",
+               "(h)", "(i)", "(j)"]
+
+    def __init__(self, tags):
+        self.tags = tags
+        self.cName = None
+
+    def consume(self, q):
+        if q.isCategory():
+            # find the last pathname component
+            if q.category is not None:
+                lastslash = q.category.rfind('/')
+                if lastslash > 0:
+                    self.cName = q.category[lastslash + 1:]
             print("\n")
+            return
+
+        if self.cName is not None:
+            print(self.cName)
+        print(q.type + ": " + str(q.name))
+        print("    " + str(q.fullText()))
+
+        # sub-questions are followed by their answers
+        for texts in q.subquestions:
+            print()
+            for text in texts:
+                print("    " + str(text))
+
+        for (choiceNum, answer) in enumerate(q.answers):
+            if q.type != "matching":
+                if self.tags:
+                    print("\n        " + self.choices[choiceNum] + ' ' +
+                          answer)
+                else:
+                    print("\n        " + answer)
+            else:
+                print("        " + answer)
+        print("\n")
+
+    def finish(self):
+        pass
 
 
 #
-# input processing state machine
+# question consumer
 #   look for questions, and list them
 #
-def summarize(file):
+class Summary:
     """ print out a list of included questions """
 
-    input = open(file, 'rb')
-    inQuestion = False
+    def consume(self, q):
+        for line in q.textLines:
+            list(line)
 
-    for line in input:
-        if inQuestion:
-            if '</questiontext>' in line:
-                inQuestion = False
+    def finish(self):
+        pass
+
+
+#
+# process one export file, with every requested consumer
+#
+def processFile(file, opts, writers):
+    """ a single pass through the file """
+    # everything we want to do with each question
+    consumers = []
+    if opts.summarize:
+        consumers.append(Summary())
+    if opts.ascii:
+        consumers.append(SimpleText(opts.tags))
+    if opts.split or not consumers:
+        consumers.append(Splitter(writers))
+
+    for q in questions(file):
+        for c in consumers:
+            c.consume(q)
+    for c in consumers:
+        c.finish()
+
+
+#
+# a stand-in for CategoryWriters that collects (rather than writes)
+# the questions for each category
+#
+class Partitions:
+    """ per-category questions, in the order they were written """
+
+    def __init__(self):
+        self.categories = OrderedDict()
+
+    def write(self, catName, lines, key=None):
+        self.categories.setdefault(catName, []).append((lines, key))
+
+    def close(self):
+        pass
+
+
+#
+# (process pool worker) process one export file, returning (rather
+# than writing) its text output and per-category questions
+#
+def partitionFile(file, opts):
+    """ return (printed output, {category: [(lines, key), ...]}) """
+    output = io.StringIO()
+    collected = Partitions()
+    with redirect_stdout(output):
+        processFile(file, opts, collected)
+    return (output.getvalue(), collected.categories)
+
+
+#
+# process the export files (in parallel with -j), yielding the results
+# in input file order
+#
+def partitions(files, opts):
+    """ (printed output, {category: [(lines, key)]}) for each file """
+    if opts.jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(opts.jobs) as pool:
+            yield from pool.map(partitionFile, files, repeat(opts))
+    else:
+        for f in files:
+            yield partitionFile(f, opts)
+
+
+#
+# process the export files in parallel, and merge the results (in
+# input file order, so the category files are the same as if the
+# exports had been processed one at a time)
+#
+def processFiles(files, opts, writers):
+    """ process many export files, each in its own worker process """
+    for (text, categories) in partitions(files, opts):
+        sys.stdout.write(text)
+        for (catName, written) in categories.items():
+            for (lines, key) in written:
+                writers.write(catName, lines, key)
+
+
+#
+# incremental re-split: the manifest records (source, position, checksum)
+# for every question in every category file, so that re-processing
+# (updated) exports only rewrites the category files that change, and
+# category files that were edited by hand are left alone
+#
+class Manifest:
+    """ category file name -> [QuestionKey, ...] (and category name) """
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.files = {}         # category file -> [QuestionKey, ...]
+        self.names = {}         # category file -> category name
+        try:
+            with open(fileName, 'r', encoding='utf-8') as input:
+                for (catFileName, entry) in json.load(input).items():
+                    self.names[catFileName] = entry["category"]
+                    self.files[catFileName] = \
+                        [QuestionKey(*k) for k in entry["questions"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def save(self):
+        manifest = {}
+        for (catFileName, keys) in sorted(self.files.items()):
+            manifest[catFileName] = {"category": self.names[catFileName],
+                                     "questions": [[*k] for k in keys]}
+        try:
+            with open(self.fileName, 'w', encoding='utf-8') as output:
+                json.dump(manifest, output, indent=1)
+        except OSError:
+            sys.stderr.write("unable to save %s\n" % self.fileName)
+
+    def known(self, catFileName, claims):
+        """ the keys for a category file (seeding it from an unmanifested
+            existing file, if there is one, whose questions belong to
+            the sources that claim their checksums, or else to the file) """
+        if not os.path.isfile(catFileName):
+            # (re)created from this run's questions
+            self.files.pop(catFileName, None)
+        elif catFileName not in self.files:
+            keys = []
+            for (position, q) in enumerate(existing(catFileName)):
+                checksum = q.checksum()
+                keys.append(QuestionKey(q.digest(),
+                                        claims.get(checksum, catFileName),
+                                        position, q.number, checksum))
+            self.files[catFileName] = keys
+        return self.files.get(catFileName, [])
+
+
+def existing(catFileName):
+    """ the (non-category) questions in an existing category file """
+    for q in questions(catFileName):
+        if not q.isCategory():
+            yield q
+
+
+def resplit(files, opts):
+    """ re-split exports, rewriting only the changed category files """
+    manifest = Manifest(MANIFEST)
+
+    # sources are recorded by their real paths (however they were named)
+    sources = [os.path.realpath(f) for f in files]
+
+    # this run's questions: category file -> source -> [(lines, key)]
+    current = OrderedDict()
+    for (f, (text, categories)) in zip(sources, partitions(files, opts)):
+        sys.stdout.write(text)
+        for (catName, written) in categories.items():
+            catFileName = catFile(catName)
+            manifest.names.setdefault(catFileName, catName)
+            current.setdefault(catFileName, OrderedDict())[f] = \
+                [(lines, key._replace(source=f)) for (lines, key) in written]
+
+    for catFileName in set(manifest.files) | set(current):
+        # a category in the manifest may not be in this run's exports
+        fromRun = current.get(catFileName, {})
+        claims = {}
+        for (f, written) in reversed(fromRun.items()):
+            claims.update((key.checksum, f) for (_, key) in written)
+        old = manifest.known(catFileName, claims)
+
+        # replace each re-processed source's questions in place
+        new = []
+        placed = set()
+        for key in old:
+            if key.source not in sources:
+                new.append((None, key))
+            elif key.source not in placed:
+                placed.add(key.source)
+                new.extend(fromRun.get(key.source, []))
+        for f in sources:
+            if f not in placed:
+                new.extend(fromRun.get(f, []))
+
+        keys = [key for (_, key) in new]
+        if [k.checksum for k in keys] != [k.checksum for k in old]:
+            if not rewrite(catFileName, manifest.names[catFileName],
+                           new, old):
+                continue
+        if keys:
+            manifest.files[catFileName] = keys
+        else:
+            manifest.files.pop(catFileName, None)
+    manifest.save()
+
+
+def rewrite(catFileName, catName, entries, old):
+    """ rewrite a category file with (lines, key) entries, whose lines
+        (if None) come from the current version of the file, unless
+        the file no longer matches its (old) manifest keys """
+    # lines for the questions we are keeping from the existing file
+    kept = {}
+    if os.path.isfile(catFileName):
+        checksums = []
+        for q in existing(catFileName):
+            checksums.append(q.checksum())
+            kept[checksums[-1]] = q.lines + ['\n']
+        if checksums != [k.checksum for k in old]:
+            sys.stderr.write("%s has been edited since it was split, "
+                             "not updated\n" % catFileName)
+            return False
+        os.remove(catFileName)
+
+    if entries:
+        writers = CategoryWriters(1)
+        for (lines, key) in entries:
+            writers.write(catName, lines if lines is not None
+                          else kept[key.checksum])
+        writers.close()
+        sys.stderr.write("updated %s\n" % catFileName)
+    return True
+
+
+#
+# full-text search: an inverted index from (lower case) words in the
+# question names, texts and answers to question ids, with category
+# and question type facets
+#
+WORD = re.compile(r"[a-z0-9]+")
+TAG = re.compile(r"<[^>]*>")
+
+
+def words(text):
+    """ the set of (lower case) words in a (raw) text, sans HTML """
+    if text is None:
+        return set()
+    return set(WORD.findall(TAG.sub(" ", text).lower()))
+
+
+def facet(name):
+    """ normalized category (last component) or type facet value """
+    return name[name.rfind('/') + 1:].strip().lower().replace(' ', '_')
+
+
+#
+# question consumer
+#   collect a search record for each question
+#
+class Indexer:
+    """ (source, number, category, type, name, text, terms) records """
+
+    def __init__(self):
+        self.catName = None
+        self.records = []
+
+    def consume(self, q):
+        if q.isCategory():
+            if q.category is not None:
+                self.catName = q.category
+            return
+
+        # (the question text may span several lines)
+        text = q.fullText()
+        terms = words(q.name) | words(text)
+        for answer in q.answers:
+            terms |= words(answer)
+        for texts in q.subquestions:
+            for sub in texts:
+                terms |= words(sub)
+        self.records.append([q.source, q.number, self.catName, q.type,
+                             q.name, text, sorted(terms)])
+
+    def finish(self):
+        pass
+
+
+def indexFile(file):
+    """ (process pool worker) the search records for one export """
+    indexer = Indexer()
+    for q in questions(file):
+        indexer.consume(q)
+    return indexer.records
+
+
+class SearchIndex:
+    """ persistent inverted index of the questions in many exports """
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.records = []       # [source, number, category, type, ...]
+        self.postings = None    # term -> [question id, ...]
+        self.facets = None      # facet -> value -> [question id, ...]
+        try:
+            with open(fileName, 'r', encoding='utf-8') as input:
+                index = json.load(input)
+            self.records = index["questions"]
+            self.postings = index["postings"]
+            self.facets = index["facets"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def replace(self, source, records):
+        """ replace all of the questions from one export """
+        self.records = [r for r in self.records if r[0] != source]
+        self.records.extend(records)
+        self.postings = None
+
+    def build(self):
+        """ (re)compute the postings and facets from the records """
+        self.postings = {}
+        self.facets = {"category": {}, "type": {}}
+        for (qid, r) in enumerate(self.records):
+            for term in r[6]:
+                self.postings.setdefault(term, []).append(qid)
+            if r[2] is not None:
+                self.facets["category"].setdefault(facet(r[2]),
+                                                   []).append(qid)
+            if r[3] is not None:
+                self.facets["type"].setdefault(facet(r[3]), []).append(qid)
+
+    def save(self):
+        if self.postings is None:
+            self.build()
+        index = {"questions": self.records, "postings": self.postings,
+                 "facets": self.facets}
+        try:
+            with open(self.fileName, 'w', encoding='utf-8') as output:
+                json.dump(index, output, separators=(',', ':'))
+        except OSError:
+            sys.stderr.write("unable to save %s\n" % self.fileName)
+
+    def search(self, query):
+        """ ids of the questions matching all of the words and
+            facets (category:NAME, type:TYPE) in a query """
+        if self.postings is None:
+            self.build()
+        matches = None
+        for token in query.split():
+            (kind, sep, value) = token.partition(':')
+            if sep and kind in self.facets:
+                found = set(self.facets[kind].get(facet(value), []))
             else:
-                list(line)
-        elif '<questiontext' in line:
-            inQuestion = True
+                found = None
+                for term in words(token):
+                    ids = set(self.postings.get(term, []))
+                    found = ids if found is None else found & ids
+                if found is None:
+                    continue
+            matches = found if matches is None else matches & found
+            if not matches:
+                break
+        return sorted(matches) if matches else []
+
+    def report(self, qid):
+        """ print out a matching question """
+        (source, number, catName, qtype, name, text) = self.records[qid][:6]
+        print("%s: %s: %s (question %s of %s)" %
+              (catName, qtype, name, number, source))
+        print("    " + " ".join(str(text).split()))
+
+
+def indexFiles(files, opts):
+    """ add the questions in many exports to the search index """
+    index = SearchIndex(SEARCH_INDEX)
+
+    # sources are recorded by their real paths (however they were named)
+    sources = [os.path.realpath(f) for f in files]
+    if opts.jobs > 1 and len(sources) > 1:
+        with ProcessPoolExecutor(opts.jobs) as pool:
+            for (f, records) in zip(sources, pool.map(indexFile, sources)):
+                index.replace(f, records)
+    else:
+        for f in sources:
+            index.replace(f, indexFile(f))
+    index.save()
+    sys.stderr.write("indexed %d questions\n" % len(index.records))
 
 
 #
@@ -321,7 +893,7 @@ if __name__ == '__main__':
     """ process specified input files, or test data """
 
     # process arguments to get input file names
-    umsg = "usage: %prog [options] READINGS.csv"
+    umsg = "usage: %prog [options] EXPORT.xml ..."
     parser = OptionParser(usage=umsg)
     parser.add_option("-a", "--ascii", dest="ascii", action="store_true",
                       default=False)
@@ -329,12 +901,51 @@ if __name__ == '__main__':
                       default=False)
     parser.add_option("-t", "--tags", dest="tags", action="store_true",
                       default=False)
+    parser.add_option("-c", "--categories", dest="split", action="store_true",
+                      default=False,
+                      help="split into per-category files (the default " +
+                      "if no other output is requested)")
+    parser.add_option("-o", "--open", dest="maxOpen", type="int", default=64,
+                      help="most category files to keep open at once")
+    parser.add_option("-j", "--jobs", dest="jobs", type="int", default=1,
+                      help="number of exports to process in parallel")
+    parser.add_option("-d", "--dups", dest="dups", default=None,
+                      choices=["skip", "report"],
+                      help="skip or report questions already in the " +
+                      "category files (see " + DEDUP_INDEX + ")")
+    parser.add_option("-m", "--manifest", dest="manifest",
+                      action="store_true", default=False,
+                      help="re-split, rewriting only changed category " +
+                      "files (see " + MANIFEST + ")")
+    parser.add_option("-i", "--index", dest="index", action="store_true",
+                      default=False,
+                      help="add the exports to the search index (see " +
+                      SEARCH_INDEX + ")")
+    parser.add_option("-q", "--query", dest="query", default=None,
+                      help="search the index for questions with all of " +
+                      "the words (and category:NAME, type:TYPE facets)")
     (opts, files) = parser.parse_args()
-    for f in files:
-        if opts.summarize:
-            summarize(f)
-        elif opts.ascii:
-            simpleText(f, opts.tags)
-        else:
-            process(f)
+    if opts.index:
+        indexFiles(files, opts)
+        sys.exit(0)
+    if opts.query is not None:
+        search = SearchIndex(SEARCH_INDEX)
+        for qid in search.search(opts.query):
+            search.report(qid)
+        sys.exit(0)
+    if opts.manifest:
+        opts.split = True
+        resplit(files, opts)
+        sys.exit(0)
+
+    dedup = None
+    if opts.dups is not None:
+        dedup = DedupIndex(DEDUP_INDEX, opts.dups == "skip")
+    writers = CategoryWriters(opts.maxOpen, dedup=dedup)
+    if opts.jobs > 1 and len(files) > 1:
+        processFiles(files, opts, writers)
+    else:
+        for f in files:
+            processFile(f, opts, writers)
+    writers.close()
     sys.exit(0)
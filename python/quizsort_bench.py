@@ -0,0 +1,250 @@
+#!/usr/bin/python3
+
+"""
+    Generate synthetic Moodle quiz exports (categories, multichoice,
+    matching, shortanswer and truefalse questions, with CDATA texts
+    and feedback blocks) and measure the throughput (MB/s) and peak
+    memory of the different quizsort.py modes on them.
+
+    Each mode is timed once without tracemalloc (for the times) and once
+    with it (for the peak memory), because tracing slows things down.
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stderr, redirect_stdout
+from optparse import Values     # pylint: disable=W4901
+
+from quizsort import CategoryWriters, indexFiles, processFile, resplit
+
+SCALES = {"1k": 1000, "10k": 10000, "100k": 100000}
+TOPICS = ("Scheduling", "Memory Management", "Deadlock", "File Systems",
+          "Synchronization", "Virtual Memory", "Networking", "Security")
+WORDS = ("process", "thread", "page", "lock", "semaphore", "cache", "disk",
+         "kernel", "interrupt", "quantum", "frame", "inode", "socket",
+         "buffer", "mutex", "deadlock", "priority", "segment", "fault")
+TYPES = ("multichoice", "multichoice", "matching", "shortanswer",
+         "truefalse")
+
+
+def sentence(rand, count):
+    """ some random words """
+    return " ".join(rand.choice(WORDS) for _ in range(count))
+
+
+def cdata(text):
+    """ the way Moodle wraps HTML question texts """
+    return f"<![CDATA[<p>{text}<br></p>]]>"
+
+
+# pylint: disable=R0914
+def generate(path, count, categories=40, seed=0):
+    """
+        write a synthetic Moodle export
+
+        args:
+            path:   name of the file to be written
+            count:  number of questions
+            categories: number of distinct categories
+            seed:   for the random number generator
+    """
+    rand = random.Random(seed)
+    names = [f"$course$/top/Default for CS111/{TOPICS[c % len(TOPICS)]} {c}"
+             for c in range(categories)]
+
+    with open(path, 'wt', encoding='utf-8') as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n<quiz>\n')
+        number = 0
+        while number < count:
+            # a category definition, followed by a run of its questions
+            out.write("<!-- question: 0  -->\n"
+                      '  <question type="category">\n'
+                      "    <category>\n"
+                      f"        <text>{rand.choice(names)}</text>\n"
+                      "    </category>\n  </question>\n\n")
+            for _ in range(min(rand.randint(1, 20), count - number)):
+                number += 1
+                write_question(out, rand, 1000 + number,
+                               rand.choice(TYPES))
+        out.write("</quiz>\n")
+
+
+def write_question(out, rand, number, qtype):
+    """ write out one synthetic question """
+    out.write(f"<!-- question: {number}  -->\n"
+              f'  <question type="{qtype}">\n'
+              f"    <name>\n      <text>{sentence(rand, 3)}</text>\n"
+              "    </name>\n"
+              '    <questiontext format="html">\n'
+              f"      <text>{cdata(sentence(rand, 12) + '?')}</text>\n"
+              "    </questiontext>\n"
+              '    <generalfeedback format="html">\n'
+              f"      <text>{cdata(sentence(rand, 8))}</text>\n"
+              "    </generalfeedback>\n"
+              "    <defaultgrade>1.0000000</defaultgrade>\n")
+
+    if qtype == "matching":
+        for _ in range(rand.randint(3, 6)):
+            out.write('    <subquestion format="html">\n'
+                      f"      <text>{cdata(sentence(rand, 2))}</text>\n"
+                      "      <answer>\n"
+                      f"        <text>{sentence(rand, 3)}</text>\n"
+                      "      </answer>\n    </subquestion>\n")
+    else:
+        if qtype == "multichoice":
+            out.write("    <single>true</single>\n"
+                      '    <correctfeedback format="html">\n'
+                      "      <text>Your answer is correct.</text>\n"
+                      "    </correctfeedback>\n")
+            answers = [cdata(sentence(rand, 4)) for _ in range(4)]
+        elif qtype == "truefalse":
+            answers = ["true", "false"]
+        else:
+            answers = [sentence(rand, 1)]
+        for (i, answer) in enumerate(answers):
+            out.write(f'    <answer fraction="{100 if i == 0 else 0}" '
+                      'format="html">\n'
+                      f"      <text>{answer}</text>\n"
+                      '      <feedback format="html">\n'
+                      f"        <text>{cdata(sentence(rand, 5))}</text>\n"
+                      "      </feedback>\n    </answer>\n")
+    out.write("  </question>\n\n")
+
+
+def options(**kwargs):
+    """ the quizsort.py options (as if from the command line) """
+    opts = {"ascii": False, "summarize": False, "tags": False,
+            "split": False, "maxOpen": 64, "jobs": 1, "dups": None,
+            "manifest": False, "index": False, "query": None}
+    opts.update(kwargs)
+    return Values(opts)
+
+
+def split_mode(paths):
+    """ splitting into per-category files """
+    writers = CategoryWriters()
+    for path in paths:
+        processFile(path, options(split=True), writers)
+    writers.close()
+
+
+def summary_mode(paths):
+    """ the -s question list """
+    for path in paths:
+        processFile(path, options(summarize=True), None)
+
+
+def ascii_mode(paths):
+    """ the -a -t simple text rendering """
+    for path in paths:
+        processFile(path, options(ascii=True, tags=True), None)
+
+
+def index_mode(paths):
+    """ building the full-text search index """
+    indexFiles(paths, options(index=True))
+
+
+def manifest_mode(paths):
+    """ incremental re-split (the second, unchanged, pass) """
+    resplit(paths, options(split=True, manifest=True))
+
+
+MODES = {"split": split_mode, "summary": summary_mode, "ascii": ascii_mode,
+         "index": index_mode, "manifest": manifest_mode}
+
+
+def run(mode, paths, workdir, trace):
+    """
+        run one mode in a fresh output directory
+
+        args:
+            mode:   function for the mode
+            paths:  names of the export files
+            workdir: where to put the output directory
+            trace:  measure peak memory (rather than time)
+        returns:    seconds or peak bytes
+    """
+    outdir = os.path.join(workdir, "out")
+    shutil.rmtree(outdir, ignore_errors=True)
+    os.makedirs(outdir)
+    cwd = os.getcwd()
+    os.chdir(outdir)
+    try:
+        with open(os.devnull, 'wt', encoding='utf-8') as devnull, \
+                redirect_stdout(devnull), redirect_stderr(devnull):
+            if mode is manifest_mode:
+                mode(paths)     # the first pass writes everything
+            if trace:
+                tracemalloc.start()
+            start = time.perf_counter()
+            mode(paths)
+            elapsed = time.perf_counter() - start
+            if trace:
+                (_, peak) = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                return peak
+            return elapsed
+    finally:
+        os.chdir(cwd)
+
+
+def main():
+    """ generate the exports and run the requested benchmarks """
+    import argparse     # pylint: disable=C0415
+    parser = argparse.ArgumentParser(description='quizsort.py benchmarks')
+    parser.add_argument("--scale", nargs='+', choices=SCALES.keys(),
+                        default=["1k", "10k"], help="numbers of questions")
+    parser.add_argument("--mode", nargs='+', choices=MODES.keys(),
+                        default=list(MODES.keys()), help="modes to time")
+    parser.add_argument("--files", type=int, default=1,
+                        help="number of exports (to split the questions)")
+    parser.add_argument("--categories", type=int, default=40,
+                        help="number of distinct categories")
+    parser.add_argument("--dir", type=str, default=None,
+                        help="where to put (and keep) the generated exports")
+    parser.add_argument("--no-memory", action='store_true',
+                        help="skip the (slower) peak memory runs")
+    args = parser.parse_args()
+
+    workdir = args.dir
+    if workdir is None:
+        # pylint: disable=R1732
+        tmp = tempfile.TemporaryDirectory()
+        workdir = tmp.name
+    workdir = os.path.abspath(workdir)
+    os.makedirs(workdir, exist_ok=True)
+
+    sys.stderr.write(f"output in {workdir}\n")
+    form = "%5s  %8s  %8s  %9s  %9s  %9s"
+    print(form % ("scale", "MB", "mode", "seconds", "MB/s", "peak MB"))
+    print(form % ("-----", "--", "----", "-------", "----", "-------"))
+    for scale in args.scale:
+        paths = []
+        per_file = SCALES[scale] // args.files
+        for num in range(args.files):
+            path = os.path.join(workdir, f"bench_{scale}_{args.categories}"
+                                f"_{num}_of_{args.files}.xml")
+            if not os.path.exists(path):
+                sys.stderr.write(f"generating {path} ...\n")
+                generate(path, per_file, args.categories, seed=num)
+            paths.append(path)
+        size = sum(os.path.getsize(p) for p in paths) / (1 << 20)
+
+        for name in args.mode:
+            secs = run(MODES[name], paths, workdir, False)
+            peak = None if args.no_memory \
+                else run(MODES[name], paths, workdir, True)
+            mem = "" if peak is None else f"{peak / (1 << 20):.1f}"
+            print(form % (scale, f"{size:.1f}", name, f"{secs:.3f}",
+                          f"{size / secs:.1f}", mem))
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
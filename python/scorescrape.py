@@ -2,169 +2,741 @@
 """
    process a file full of scraped coments vs a rubric and
    produce a score file
+
+   The rubric is digested once (into a read-only Rubric), and each
+   file of scraped comments is scored on its own ScoreSheet, so many
+   submissions can be scored in parallel (-j), with their reports
+   still written out in input order.  The rubric's output template is
+   compiled (and cached, by rubric content) into text segments and
+   score/name/comment slots, so each report is a single join.  Each
+   input file is memory mapped, and lexed into Events in two passes:
+   one that finds the name lines by their (literal) tag, and one that
+   finds and lexes the SCORE lines with a compiled regular expression.
+   Graded .pdf files are read directly: the comments (/Contents) of
+   their annotations are extracted, page by page, and scanned the same
+   way.  The -s option collects every student's item scores into
+   one table, and exports per-item class statistics.
 """
 import sys
 import os.path
 import argparse
+import csv
+import json
+import bisect
+import hashlib
+import mmap
+import pickle
+import re
+import zlib
+from collections import namedtuple
+from array import array
+from contextlib import nullcontext
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+
+CACHE_VERSION = 1       # format of the compiled rubric cache
+
+# kinds of template slots
+SCORE = 0               # an item's score/max
+NAME = 1                # the student name
+COMMENTS = 2            # an item's comments (one per line)
+
+
+class Template:     # pylint: disable=R0903
+    """
+    the output template, compiled into literal text segments and
+    (kind, item) slots, so that rendering a report is a single pass
+    over precomputed segments
+    """
 
-template = []       # standard score output
-
-item_default = {}    # per item, default value
-item_score = {}      # per item, score
-min_score = {}       # per item, min possible
-max_score = {}       # per item, max possible
-item_comments = {}   # per item, comments
-student_name = ""
-
-
-def digest(rubric, tag):
-    """ read rubric file and accumulate a score model """
-    if os.path.exists(rubric):
-        with open(rubric, 'rb', encoding='ascii') as instream:
-            for line in instream:
-                if line.startswith("#"):
-                    fields = line.split()
-                    if len(fields) >= 4 and fields[1] == tag:
-                        item = fields[2]
-                        max_score[item] = int(fields[3])
-                        min_score[item] = int(fields[4]) if len(fields) > 4 else 0
-                        item_default[item] = \
-                            int(fields[5]) if len(fields) > 5 else int(fields[3])
+    def __init__(self, lines, items, tag):
+        self.segments = []
+        self.unknown = []       # identifiers that are not rubric items
+        for line in lines:
+            noted = []
+            pos = 0
+            while True:
+                i = line.find("$", pos)
+                if i < 0:
+                    break
+                # find the end of the identifier
+                start = i + 1
+                end = start
+                while line[start:end+1].isalnum():
+                    end += 1
+                ident = line[start:end]
+                self.literal(line[pos:i])
+                if ident in items or ident == "TOTAL":
+                    self.segments.append((SCORE, ident))
+                    if ident in items:
+                        noted.append(ident)
+                elif ident == "STUDENTNAME":
+                    self.segments.append((NAME, None))
                 else:
-                    # it is output
-                    template.append(line)
-    else:
-        sys.stderr.write("unable to open rubric file " + rubric)
-
-
-def score_reset():
-    """ reset all scores to default values """
-    for k in item_default.keys():
-        item_score[k] = item_default[k]
-        item_comments[k] = []
-    student_name = ""
-
-
-def score(line, tag):
-    """ parse a score out of a SCORE comment """
-    # lex off the score item name
-    start = line.index(tag) + len(tag)
-    while line[start:start+1].isspace():
-        start += 1
-    end = start + 1
-    while line[start:end+1].isalnum():
-        end += 1
-    item = line[start:end]
-    if item not in item_score.keys():
-        sys.stderr.write(f"Unknown rubric item: {line}")
-        return
+                    self.unknown.append(f"unknown {tag} item: {ident}\n")
+                    self.literal(line[i:end])
+                pos = end
+            self.literal(line[pos:])
+            for ident in noted:
+                self.segments.append((COMMENTS, ident))
+
+    def literal(self, text):
+        """ add literal text (to the previous literal, if possible) """
+        if not text:
+            return
+        if self.segments and isinstance(self.segments[-1], str):
+            self.segments[-1] += text
+        else:
+            self.segments.append(text)
+
+    def render(self, sheet, comments=False):
+        """ a ScoreSheet's report """
+        output = []
+        for seg in self.segments:
+            if isinstance(seg, str):
+                output.append(seg)
+            elif seg[0] == SCORE:
+                output.append(f"{sheet.item_score[seg[1]]:.1f}/"
+                              f"{sheet.max_score[seg[1]]:.1f}")
+            elif seg[0] == NAME:
+                output.append(sheet.student_name)
+            elif comments:
+                for comment in sheet.item_comments[seg[1]]:
+                    output.append("\t" + comment)
+        return "".join(output)
 
-    # skip over colons and white space
-    start = end
-    while line[start:start+1].isspace() or line[start:start+1] == ":":
-        start += 1
-
-    # see if the score item starts with a +/-
-    sign = line[start:start+1]
-    if sign == "+" or sign == "-":
-        start += 1
-
-    # find the end of the number
-    end = start + 1
-    while line[end:end+1].isdigit() or line[end:end+1] == ".":
-        end += 1
-    num = float(line[start:end])
-
-    # calculate the updated score
-    cur = item_score[item]
-    if sign == "+":
-        cur += num
-    elif sign == "-":
-        cur -= num
-    else:
-        cur = num
 
-    # sanity check the updated score
-    if cur < min_score[item]:
-        sys.stderr.write(f"ERROR: {item} below minimum {min_score[item]}\n")
-        cur = min_score[item]
-    elif cur > max_score[item]:
-        sys.stderr.write(f"ERROR: {item} above maximum {max_score[item]}\n")
-        cur = max_score[item]
+class Rubric:     # pylint: disable=R0903
+    """ the (read-only) score model and compiled output template """
 
-    item_score[item] = cur
+    def __init__(self, tag):
+        self.tag = tag
+        self.template = Template([], {}, tag)
+        self.default = {}       # per item, default value
+        self.min_score = {}     # per item, min possible
+        self.max_score = {}     # per item, max possible
+
+    def digest(self, rubric):
+        """
+        read rubric file and accumulate a score model, from its cache
+        if that was compiled from the same rubric (content and tag)
+        """
+        try:
+            with open(rubric, 'rb') as instream:
+                content = instream.read()
+        except OSError:
+            sys.stderr.write("unable to open rubric file " + rubric + "\n")
+            return
+        key = hashlib.sha1(f"{CACHE_VERSION} {self.tag}\n".encode('utf-8') +
+                           content).hexdigest()
+
+        (directory, base) = os.path.split(rubric)
+        cache = os.path.join(directory, "." + base + ".cache")
+        try:
+            with open(cache, 'rb') as instream:
+                compiled = pickle.load(instream)
+            if compiled['key'] != key:
+                raise KeyError(key)
+            self.__dict__.update(compiled['rubric'])
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError,
+                TypeError, AttributeError):
+            self.compile(content.decode('utf-8').splitlines(keepends=True))
+            try:
+                with open(cache, 'wb') as outstream:
+                    pickle.dump({'key': key, 'rubric': self.__dict__},
+                                outstream)
+            except OSError:
+                pass    # the cache is only an optimization
+
+        for msg in self.template.unknown:
+            sys.stderr.write(msg)
+
+    def compile(self, lines):
+        """ the score model and template from the lines of a rubric """
+        template = []
+        for line in lines:
+            if line.startswith("#"):
+                fields = line.split()
+                if len(fields) >= 4 and fields[1] == self.tag:
+                    item = fields[2]
+                    self.max_score[item] = int(fields[3])
+                    self.min_score[item] = \
+                        int(fields[4]) if len(fields) > 4 else 0
+                    self.default[item] = \
+                        int(fields[5]) if len(fields) > 5 \
+                        else int(fields[3])
+            else:
+                # it is output
+                template.append(line)
+        self.template = Template(template, self.default, self.tag)
+
+
+class ScoreSheet:
+    """ the scores, comments and name for one submission """
+
+    def __init__(self, rubric):
+        self.rubric = rubric
+        self.item_score = dict(rubric.default)      # per item, score
+        self.max_score = dict(rubric.max_score)     # (plus the TOTAL)
+        self.item_comments = {k: [] for k in rubric.default}
+        self.student_name = ""
+        self.errors = []        # messages for this submission
+        self.read = False       # the submission could be read
+
+    def error(self, msg):
+        """ note a problem (to be reported with this submission) """
+        self.errors.append(msg)
+
+    def score(self, event):
+        """ apply a SCORE event to this sheet """
+        item = event.item
+        if item not in self.item_score:
+            self.error(f"Unknown rubric item: {event.text}\n")
+            return
+        if event.value is None:
+            self.error(f"No score for {item}: {event.text}\n")
+            return
+
+        # calculate the updated score
+        cur = self.item_score[item]
+        if event.sign == "+":
+            cur += event.value
+        elif event.sign == "-":
+            cur -= event.value
+        else:
+            cur = event.value
 
-    # look for comments
-    while line[end:end+1].isspace():
-        end += 1
-    if end < len(line):
-        item_comments[item].append(line[end:])
-    return
+        # sanity check the updated score
+        lowest = self.rubric.min_score[item]
+        highest = self.rubric.max_score[item]
+        if cur < lowest:
+            self.error(f"ERROR: {item} below minimum {lowest}\n")
+            cur = lowest
+        elif cur > highest:
+            self.error(f"ERROR: {item} above maximum {highest}\n")
+            cur = highest
 
+        self.item_score[item] = cur
+
+        # look for comments
+        if event.comment:
+            self.item_comments[item].append(event.comment + "\n")
+
+    def process(self, file, nametag):
+        """ process a file of scraped comments """
+        if not os.path.exists(file):
+            self.error("unable to open input file " + file + "\n")
+            return
 
-def process(file, tag, nametag):
-    """ process a file of scraped comments """
-    if os.path.exists(file):
         # find and process all of the SCORE comments
-        input = open(file, 'rb')
-        for line in input:
-            if tag in line:
-                score(line, tag)
-            elif nametag in line:
-                global student_name
-                student_name = line
-
-        input.close()
-    else:
-        sys.stderr.write("unable to open input file " + file)
-
-
-def total():
-    """ compute the total score for this file """
-    sumtotal = 0
-    maxtotal = 0
-    for k in item_score.keys():
-        sumtotal += item_score[k]
-        maxtotal += max_score[k]
-    # FIX find some way to exclude extra credit
-    item_score["TOTAL"] = sumtotal
-    max_score["TOTAL"] = maxtotal
-
-
-def interpolate(comments=False):
-    """ produce the standard template output, interpolating scores """
-    for line in template:
-        if "$" in line:
-            for i in range(0, len(line)):
-                if line[i:i+1] == "$":
-                    # find the end of the identifier
-                    start = i+1
-                    end = i+1
-                    while l[start:end+1].isalnum():
-                        end += 1
-                    id = line[start:end]
-                    if id in item_score.keys():
-                        sys.stdout.write(l[0:start-1])
-                        sys.stdout.write("%.1f/%.1f" %
-                                         (item_score[id], max_score[id]))
-                        sys.stdout.write(l[end:])
-                        if comments and id in item_comments.keys():
-                            for line in item_comments[id]:
-                                sys.stdout.write("\t" + l)
-                    elif id == "STUDENTNAME":
-                        sys.stdout.write(student_name + "\n")
-                    else:
-                        sys.stderr.write(f"unknown {tag} item: {id}\n")
+        try:
+            for event in scan(file, self.rubric.tag, nametag):
+                if event.kind == SCORE:
+                    self.score(event)
+                else:
+                    self.student_name = event.text
+        except (OSError, ValueError, IndexError, RecursionError) as err:
+            self.error(f"unable to read input file {file}: {err}\n")
         else:
-            sys.stdout.write(l)
+            self.read = True
 
+    def total(self):
+        """ compute the total score for this file """
+        sumtotal = 0
+        maxtotal = 0
+        for k in self.rubric.default:
+            sumtotal += self.item_score[k]
+            maxtotal += self.max_score[k]
+        # FIX find some way to exclude extra credit
+        self.item_score["TOTAL"] = sumtotal
+        self.max_score["TOTAL"] = maxtotal
 
-if __name__ == '__main__':
+    def scores(self):
+        """ the item scores (in rubric order, then the TOTAL) """
+        return [self.item_score[k] for k in self.rubric.default] + \
+            [self.item_score["TOTAL"]]
+
+    def interpolate(self, comments=False):
+        """ produce the standard template output, interpolating scores """
+        return self.rubric.template.render(self, comments)
+
+
+#
+# a SCORE (or student name) line, lexed into its fields:
+#   tag item[:] [+-]number comment
+#
+Event = namedtuple('Event', 'kind item sign value comment text')
+
+
+@lru_cache(maxsize=None)
+def scanner(tag):
+    """ a (bytes) regular expression that finds and lexes score tags """
+    return re.compile(re.escape(tag.encode('utf-8')) +
+                      rb"[ \t]*(?P<item>[A-Za-z0-9]*)[ \t:]*"
+                      rb"(?P<sign>[-+]?)(?P<num>[0-9.]*)[ \t]*"
+                      rb"(?P<comment>[^\n]*)")
+
+
+def scan(file, tag, nametag):
+    """ the score and name Events in a (memory mapped) file or PDF """
+    if file.lower().endswith(".pdf"):
+        for text in pdf_comments(file):
+            yield from events(text, tag, nametag)
+        return
+
+    with open(file, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from events(data, tag, nametag)
+
+
+def events(data, tag, nametag):
+    """ the score and name Events in a (bytes-like) text """
+    def text(raw):
+        return raw.decode('utf-8', errors='replace').rstrip("\r")
+
+    # the (few) name lines, unless they also contain a score
+    names = []
+    end = 0
+    for match in re.finditer(re.escape(nametag.encode('utf-8')), data):
+        if match.start() < end:
+            continue
+        start = data.rfind(b"\n", 0, match.start()) + 1
+        end = data.find(b"\n", match.end())
+        if end < 0:
+            end = len(data)
+        if data.find(tag.encode('utf-8'), start, end) < 0:
+            names.append((start, text(data[start:end])))
+    names.reverse()
+
+    # the score lines (each match runs to the end of its line,
+    # so only the first tag on each line counts)
+    for match in scanner(tag).finditer(data):
+        while names and names[-1][0] < match.start():
+            yield Event(NAME, None, None, None, None, names.pop()[1])
+        try:
+            value = float(match.group('num'))
+        except ValueError:
+            value = None
+        yield Event(SCORE, match.group('item').decode('ascii'),
+                    match.group('sign').decode('ascii'), value,
+                    text(match.group('comment')), text(match.group(0)))
+    while names:
+        yield Event(NAME, None, None, None, None, names.pop()[1])
+
+
+#
+# PDF annotation extraction
+#   just enough of a PDF parser (objects, object streams, FlateDecode,
+#   the page tree) to get the comment (/Contents) of each annotation,
+#   one page at a time
+#
+Ref = namedtuple('Ref', 'num gen')              # indirect reference
+Stream = namedtuple('Stream', 'dict data')      # stream (raw data)
+
+PDF_SPACE = re.compile(rb"(?:[\x00\t\n\x0c\r ]+|%[^\r\n]*)*")
+PDF_NAME = re.compile(rb"/([^\x00\t\n\x0c\r ()<>\[\]{}/%]*)")
+PDF_NUMBER = re.compile(rb"[-+]?(?:\d+\.?\d*|\.\d+)")
+PDF_REF = re.compile(rb"\s+(\d+)\s+R(?![A-Za-z])")
+PDF_KEYWORD = re.compile(rb"[A-Za-z]+")
+PDF_OBJ = re.compile(rb"(?<![0-9])(\d+)\s+(\d+)\s+obj(?![A-Za-z])")
+PDF_STRING = re.compile(rb"[()\\]")
+PDF_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b",
+               b"f": b"\f", b"(": b"(", b")": b")", b"\\": b"\\"}
+
+
+class PdfParser:
+    """ parser for the (COS) values in PDF data """
+
+    def __init__(self, data):
+        self.data = data
+
+    def at(self, pos, token):
+        """ does the data at an offset start with a token """
+        return self.data[pos:pos+len(token)] == token
+
+    def value(self, pos):
+        """ parse the value at an offset: (value, following offset) """
+        # pylint: disable=R0911, R0912
+        data = self.data
+        pos = PDF_SPACE.match(data, pos).end()
+        c = data[pos:pos+1]
+        if self.at(pos, b"<<"):
+            result = {}
+            pos += 2
+            while True:
+                pos = PDF_SPACE.match(data, pos).end()
+                if self.at(pos, b">>") or pos >= len(data):
+                    return (result, pos + 2)
+                (key, pos) = self.value(pos)
+                (val, pos) = self.value(pos)
+                if isinstance(key, str):
+                    result[key] = val
+        if c == b"[":
+            result = []
+            pos += 1
+            while True:
+                pos = PDF_SPACE.match(data, pos).end()
+                if self.at(pos, b"]") or pos >= len(data):
+                    return (result, pos + 1)
+                (val, pos) = self.value(pos)
+                result.append(val)
+        if c == b"(":
+            return self.literal(pos + 1)
+        if c == b"<":
+            end = data.find(b">", pos)
+            if end < 0:
+                end = len(data)
+            hexits = re.sub(rb"[^0-9A-Fa-f]", b"", data[pos+1:end])
+            if len(hexits) % 2:
+                hexits += b"0"
+            return (bytes.fromhex(hexits.decode('ascii')), end + 1)
+        if c == b"/":
+            match = PDF_NAME.match(data, pos)
+            name = re.sub(rb"#([0-9A-Fa-f]{2})",
+                          lambda m: bytes.fromhex(m.group(1).decode()),
+                          match.group(1))
+            return (name.decode('latin-1'), match.end())
+        match = PDF_NUMBER.match(data, pos)
+        if match:
+            number = match.group(0)
+            if b"." in number:
+                return (float(number), match.end())
+            ref = PDF_REF.match(data, match.end())
+            if ref:
+                return (Ref(int(number), int(ref.group(1))), ref.end())
+            return (int(number), match.end())
+        match = PDF_KEYWORD.match(data, pos)
+        if match:
+            word = match.group(0)
+            return ({b"true": True, b"false": False}.get(word), match.end())
+        # something we do not understand: skip it
+        return (None, pos + 1)
+
+    def literal(self, pos):
+        """ a (string) literal: (bytes, following offset) """
+        data = self.data
+        parts = []
+        depth = 1
+        while True:
+            match = PDF_STRING.search(data, pos)
+            if match is None:
+                parts.append(data[pos:])
+                return (b"".join(parts), len(data))
+            parts.append(data[pos:match.start()])
+            pos = match.end()
+            c = match.group(0)
+            if c == b"(":
+                depth += 1
+            elif c == b")":
+                depth -= 1
+                if depth == 0:
+                    return (b"".join(parts), pos)
+            else:
+                esc = data[pos:pos+1]
+                octal = re.match(rb"[0-7]{1,3}", data[pos:pos+3])
+                if octal:
+                    parts.append(bytes([int(octal.group(0), 8) & 0xff]))
+                    pos += len(octal.group(0))
+                    continue
+                if esc == b"\r" and data[pos+1:pos+2] == b"\n":
+                    pos += 1    # line continuation
+                elif esc not in b"\r\n":
+                    parts.append(PDF_ESCAPES.get(esc, esc))
+                pos += 1
+            if c != b"\\":
+                parts.append(c)
+
+
+class PdfFile:
+    """ the objects (and annotations) in a PDF file """
+
+    def __init__(self, data):
+        self.data = data
+        self.parser = PdfParser(data)
+        self.offsets = {}       # object number -> offset (of its value)
+        self.packed = {}        # object number -> (ObjStm number, index)
+        self.cache = {}         # object number -> (parsed) value
+        starts = []
+        for match in PDF_OBJ.finditer(data):
+            # later (incremental update) definitions win
+            self.offsets[int(match.group(1))] = match.end()
+            starts.append((match.end(), int(match.group(1))))
+        if re.search(rb"/Encrypt\s*\d+\s+\d+\s+R", data):
+            raise ValueError("encrypted PDF")
+
+        # unpack the object streams (in the objects with those types)
+        for match in re.finditer(rb"/Type\s*/ObjStm(?![A-Za-z])", data):
+            i = bisect.bisect(starts, (match.start(), 0)) - 1
+            if i >= 0 and self.offsets.get(starts[i][1]) == starts[i][0]:
+                self.unpack(starts[i][1])
+
+    def object(self, num):
+        """ the (parsed) value of an object, by number """
+        if num in self.cache:
+            return self.cache[num]
+        self.cache[num] = None      # (in case of reference loops)
+        if num in self.offsets:
+            (value, pos) = self.parser.value(self.offsets[num])
+            pos = PDF_SPACE.match(self.data, pos).end()
+            if isinstance(value, dict) and \
+                    self.parser.at(pos, b"stream"):
+                value = Stream(value, self.stream(value, pos + 6))
+        elif num in self.packed:
+            (container, index) = self.packed[num]
+            value = self.cache[container][index]
+        else:
+            value = None
+        self.cache[num] = value
+        return value
+
+    def stream(self, info, pos):
+        """ the raw data of a stream (that starts at an offset) """
+        if self.parser.at(pos, b"\r\n"):
+            pos += 2
+        elif self.parser.at(pos, b"\n"):
+            pos += 1
+        length = self.resolve(info.get("Length"))
+        if isinstance(length, int) and \
+                self.data.find(b"endstream", pos + length,
+                               pos + length + 32) >= 0:
+            return self.data[pos:pos+length]
+        end = self.data.find(b"endstream", pos)
+        return self.data[pos:end if end >= 0 else len(self.data)]
+
+    def unpack(self, num):
+        """ note the (compressed) objects in an object stream """
+        stream = self.object(num)
+        if not isinstance(stream, Stream):
+            return
+        data = self.decode(stream)
+        first = self.resolve(stream.dict.get("First"))
+        count = self.resolve(stream.dict.get("N"))
+        if data is None or not isinstance(first, int) or \
+                not isinstance(count, int):
+            return
+        header = [int(n) for n in data[:first].split()]
+        inner = PdfParser(data)
+        values = []
+        for i in range(min(count, len(header) // 2)):
+            (objnum, offset) = (header[2 * i], header[2 * i + 1])
+            values.append(inner.value(first + offset)[0])
+            if objnum not in self.offsets:
+                self.packed[objnum] = (num, i)
+        self.cache[num] = values
+
+    def resolve(self, value):
+        """ follow an indirect reference """
+        while isinstance(value, Ref):
+            value = self.object(value.num)
+        return value
+
+    def decode(self, stream):
+        """ the decoded data of a stream (None if we cannot) """
+        filters = self.resolve(stream.dict.get("Filter"))
+        if filters is None:
+            filters = []
+        elif not isinstance(filters, list):
+            filters = [filters]
+        parms = self.resolve(stream.dict.get("DecodeParms"))
+        if isinstance(parms, dict) and \
+                self.resolve(parms.get("Predictor", 1)) != 1:
+            return None
+        data = bytes(stream.data)
+        for name in filters:
+            if self.resolve(name) not in ("FlateDecode", "Fl"):
+                return None
+            try:
+                data = zlib.decompressobj().decompress(data)
+            except zlib.error:
+                return None
+        return data
+
+    def pages(self):
+        """ the page dictionaries, in (page tree) order """
+        roots = re.findall(rb"/Root\s+(\d+)\s+\d+\s+R", self.data)
+        catalog = self.object(int(roots[-1])) if roots else None
+        if not isinstance(catalog, dict):
+            # no trailer: the pages, in object order
+            for num in sorted(set(self.offsets) | set(self.packed)):
+                page = self.object(num)
+                if isinstance(page, dict) and page.get("Type") == "Page":
+                    yield page
+            return
+
+        seen = set()
+        todo = [catalog.get("Pages")]
+        while todo:
+            node = todo.pop()
+            if isinstance(node, Ref):
+                if node.num in seen:
+                    continue
+                seen.add(node.num)
+            node = self.resolve(node)
+            if not isinstance(node, dict):
+                continue
+            kids = self.resolve(node.get("Kids"))
+            if isinstance(kids, list):
+                todo.extend(reversed(kids))
+            elif node.get("Type") != "Pages":
+                yield node
+
+    def comments(self, page):
+        """ the text of the annotations on a page """
+        lines = []
+        annots = self.resolve(page.get("Annots"))
+        for annot in annots if isinstance(annots, list) else []:
+            annot = self.resolve(annot)
+            if not isinstance(annot, dict) or \
+                    annot.get("Subtype") == "Popup":
+                continue
+            contents = self.resolve(annot.get("Contents"))
+            if isinstance(contents, bytes) and contents:
+                text = pdf_text(contents)
+                lines.append(text.replace("\r\n", "\n").replace("\r", "\n"))
+        return "".join(line + "\n" for line in lines)
+
+
+def pdf_text(string):
+    """ decode a PDF text string (UTF-16 or PDFDocEncoding) """
+    if string.startswith(b"\xfe\xff"):
+        return string[2:].decode('utf-16-be', errors='replace')
+    if string.startswith(b"\xef\xbb\xbf"):
+        return string[3:].decode('utf-8', errors='replace')
+    # (close enough to PDFDocEncoding for comments)
+    return string.decode('latin-1')
+
+
+def pdf_comments(file):
+    """ the annotation text (bytes) for each page of a PDF file """
+    with open(file, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            raise ValueError("empty PDF")
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            # (readers accept some junk before the header)
+            if data.find(b"%PDF-", 0, 1024) < 0:
+                raise ValueError("not a PDF")
+            pdf = PdfFile(data)
+            pages = 0
+            for page in pdf.pages():
+                pages += 1
+                yield pdf.comments(page).encode('utf-8')
+            if pages == 0:
+                raise ValueError("no pages in PDF")
+
+
+def score_file(file, rubric, args):
+    """
+    (process pool worker) score one file: (report, errors, scores),
+    where scores is None if the file could not be read
+    """
+    sheet = ScoreSheet(rubric)
+    sheet.process(file, args.name)
+    sheet.total()
+    report = sheet.interpolate(args.comments)
+    return (report, sheet.errors, sheet.scores() if sheet.read else None)
+
+
+def score_files(files, rubric, args):
+    """ score each file, yielding the results in input order """
+    if args.jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            yield from pool.map(score_file, files, repeat(rubric),
+                                repeat(args), chunksize=8)
+    else:
+        for f in files:
+            yield score_file(f, rubric, args)
+
+
+class ClassStats:
+    """
+    accumulate every student's item scores into one (columnar) table,
+    and compute per-item statistics over all of them at once (with numpy)
+    """
+    BINS = 10       # histogram bins (between each item's min and max)
+    FIELDS = ("item", "min", "max", "students", "mean", "median",
+              "at_min", "at_max")
+
+    def __init__(self, rubric):
+        self.items = list(rubric.default) + ["TOTAL"]
+        self.lowest = [rubric.min_score[k] for k in rubric.default]
+        self.lowest.append(sum(self.lowest))
+        self.highest = [rubric.max_score[k] for k in rubric.default]
+        self.highest.append(sum(self.highest))
+        self.table = array('d')     # student-major item scores
+        self.students = 0
+
+    def add(self, scores):
+        """ add one student's scores (in item order) """
+        self.table.extend(scores)
+        self.students += 1
+
+    def compute(self):
+        """
+        compute the per-item statistics
+
+        returns: list of dicts (one per item, TOTAL last)
+            mean, median:   of the students' scores
+            at_min, at_max: fraction of students at the item's min/max
+            histogram:      student counts in BINS equal bins from
+                            the item's min to its max
+        """
+        import numpy as np      # pylint: disable=C0415
+        if self.students == 0:
+            return []
+        num = len(self.items)
+        table = np.frombuffer(self.table).reshape(self.students, num)
+        lowest = np.array(self.lowest, dtype=float)
+        highest = np.array(self.highest, dtype=float)
+
+        mean = table.mean(axis=0)
+        median = np.median(table, axis=0)
+        at_min = (table <= lowest).mean(axis=0)
+        at_max = (table >= highest).mean(axis=0)
+
+        # bin every score at once, then count (item, bin) pairs
+        span = np.where(highest > lowest, highest - lowest, 1.0)
+        bins = ((table - lowest) / span * self.BINS).astype(int)
+        bins = np.clip(bins, 0, self.BINS - 1)
+        cells = bins + np.arange(num) * self.BINS
+        hist = np.bincount(cells.ravel(), minlength=num * self.BINS)
+        hist = hist.reshape(num, self.BINS)
+
+        return [{"item": item, "min": self.lowest[i],
+                 "max": self.highest[i], "students": self.students,
+                 "mean": round(float(mean[i]), 3),
+                 "median": float(median[i]),
+                 "at_min": round(float(at_min[i]), 3),
+                 "at_max": round(float(at_max[i]), 3),
+                 "histogram": [int(n) for n in hist[i]]}
+                for (i, item) in enumerate(self.items)]
+
+    def write(self, file_name):
+        """ export the statistics (JSON for *.json, else CSV) """
+        stats = self.compute()
+        with (open(file_name, 'w', encoding='utf-8', newline='')
+              if file_name != "-" else nullcontext(sys.stdout)) as output:
+            if file_name.endswith(".json"):
+                json.dump(stats, output, indent=1)
+                output.write("\n")
+                return
+            writer = csv.writer(output, lineterminator="\n")
+            writer.writerow(self.FIELDS +
+                            tuple(f"bin{b}" for b in range(self.BINS)))
+            for row in stats:
+                writer.writerow([row[k] for k in self.FIELDS] +
+                                row["histogram"])
+
+
+def main():
     """ process specified input files, or test data """
 
     # process arguments to get input file names
-    DESCR = "extract/accumulate score information from file annotations"
-    parser = argparse.ArgumentParser(description=DESCR)
+    descr = "extract/accumulate score information from file annotations"
+    parser = argparse.ArgumentParser(description=descr)
     parser.add_argument("file", nargs="+",
                         help="score files to be scraped")
     parser.add_argument("-r", "--rubric", default=None,
@@ -177,27 +749,47 @@ if __name__ == '__main__':
                         help="verbose output for each copy")
     parser.add_argument("-c", "--comments",  action="store_true",
                         help="preserve score comments")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of files to score in parallel")
+    parser.add_argument("-s", "--stats", default=None, metavar="FILE",
+                        help="export class-wide per-item statistics " +
+                        "(JSON for *.json, else CSV, - for stdout)")
     args = parser.parse_args()
 
     # digest the rubric
+    rubric = Rubric(args.tag)
     if args.rubric is not None:
-        digest(args.rubric, args.tag)
+        rubric.digest(args.rubric)
 
     # dump out the known rubric items
     if args.verbose:
         sys.stdout.write("Rubric items:\n")
-        for k in item_default.keys():
-            sys.stdout.write("\t%s min=%d, max=%d, dflt=%d\n" %
-                             (k, min_score[k], max_score[k], item_default[k]))
+        for (k, dflt) in rubric.default.items():
+            sys.stdout.write(f"\t{k} min={rubric.min_score[k]}, "
+                             f"max={rubric.max_score[k]}, dflt={dflt}\n")
 
     # process the specified input files
-    if file is None:
-        parser.print_help()
-    else:
-        for f in file:
-            score_reset()
-            process(f, args.tag, args.name)
-            total()
-            interpolate(args.comments)
+    stats = ClassStats(rubric)
+    unread = 0      # submissions left out of the statistics
+    for (report, errors, scores) in score_files(args.file, rubric, args):
+        sys.stdout.flush()
+        for msg in errors:
+            sys.stderr.write(msg)
+        sys.stderr.flush()
+        sys.stdout.write(report)
+        if scores is not None:
+            stats.add(scores)
+        else:
+            unread += 1
+
+    if args.stats is not None:
+        if unread > 0:
+            sys.stderr.write(f"{unread} unreadable input file(s) "
+                             "excluded from statistics\n")
+        stats.write(args.stats)
 
     sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()